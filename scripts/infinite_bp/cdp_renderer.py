@@ -0,0 +1,296 @@
+import asyncio
+import base64
+import concurrent.futures
+import json
+import shutil
+import socket
+import subprocess
+import tempfile
+import threading
+import time
+import urllib.request
+
+try:
+    import websockets
+except ImportError:
+    websockets = None
+
+from page_scripts import CAPTURE_SCRIPT, READY_SCRIPT
+
+class CdpError(Exception):
+    """An error reported by Chrome over the DevTools protocol"""
+
+class CdpConnection:
+    def __init__(self, websocket, timeout=30):
+        """
+        One DevTools websocket to the browser; every tab is a flattened
+        session multiplexed over it.
+
+        Args:
+            timeout (float): Seconds to wait for the reply to a command
+        """
+        self.websocket = websocket
+        self.timeout = timeout
+        self.next_id = 0
+        self.pending = {}
+        self.reader = asyncio.ensure_future(self.read())
+
+    async def send(self, method, params=None, session_id=None):
+        """
+        Returns:
+            dict: The command's result
+
+        Raises:
+            ConnectionError: The connection to the browser is gone
+            TimeoutError: No reply within the timeout
+        """
+        if self.reader.done():
+            raise ConnectionError("DevTools connection closed")
+        self.next_id += 1
+        message_id = self.next_id
+        message = {'id': message_id, 'method': method, 'params': params or {}}
+        if session_id:
+            message['sessionId'] = session_id
+        future = asyncio.get_running_loop().create_future()
+        self.pending[message_id] = future
+        try:
+            await asyncio.wait_for(self.websocket.send(json.dumps(message)), self.timeout)
+            return await asyncio.wait_for(future, self.timeout)
+        except asyncio.TimeoutError:
+            raise TimeoutError(f"No reply to {method} within {self.timeout}s")
+        finally:
+            self.pending.pop(message_id, None)
+
+    async def read(self):
+        try:
+            async for raw in self.websocket:
+                message = json.loads(raw)
+                # Events have no id; nothing here listens to them
+                future = self.pending.pop(message.get('id'), None)
+                if future is None or future.done():
+                    continue
+                if 'error' in message:
+                    future.set_exception(CdpError(message['error'].get('message', str(message['error']))))
+                else:
+                    future.set_result(message.get('result', {}))
+        finally:
+            for future in self.pending.values():
+                if not future.done():
+                    future.set_exception(ConnectionError("DevTools connection closed"))
+
+class CdpTab:
+    def __init__(self, connection, target_id, session_id):
+        self.connection = connection
+        self.target_id = target_id
+        self.session_id = session_id
+        self.renders = 0
+
+    async def send(self, method, params=None):
+        return await self.connection.send(method, params, self.session_id)
+
+    async def evaluate(self, expression):
+        result = await self.send('Runtime.evaluate', {'expression': expression, 'returnByValue': True})
+        if 'exceptionDetails' in result:
+            raise CdpError(result['exceptionDetails'].get('text', 'Script error'))
+        return result['result'].get('value')
+
+    async def poll(self, expression, timeout, interval=0.05):
+        """
+        Returns:
+            The expression's first truthy value, or None if it timed out
+        """
+        deadline = time.monotonic() + timeout
+        while time.monotonic() < deadline:
+            value = await self.evaluate(expression)
+            if value:
+                return value
+            await asyncio.sleep(interval)
+        return None
+
+class CdpRenderer:
+    def __init__(self, chrome_binary='google-chrome', tabs=4, max_renders_per_tab=50, ready_timeout=60,
+                 capture_timeout=60, button_selector='#root > button', scripts=(), chrome_args=(), command_timeout=30):
+        """
+        Render blueprints in tabs of one headless Chrome driven directly over
+        the DevTools protocol, without chromedriver or Selenium in between.
+        Renders from any number of threads share the browser, one tab each.
+
+        Args:
+            chrome_binary (str): Chrome executable
+            tabs (int): Tabs rendering at once
+            max_renders_per_tab (int): Close a tab after this many renders (0 = never)
+            ready_timeout (float): Seconds to wait for the page's readiness signal
+            capture_timeout (float): Seconds to wait for the exported PNG
+            button_selector (str): The page's export button
+            scripts (iterable): Extra scripts to run in every page before the app
+            chrome_args (iterable): Extra Chrome command line flags
+            command_timeout (float): Seconds to wait for Chrome to answer one DevTools command
+        """
+        if websockets is None:
+            raise ImportError("The cdp render backend needs websockets: pip install websockets")
+        self.chrome_binary = chrome_binary
+        self.tabs = max(1, tabs)
+        self.max_renders = max_renders_per_tab
+        self.ready_timeout = ready_timeout
+        self.capture_timeout = capture_timeout
+        self.button_selector = button_selector
+        self.scripts = [CAPTURE_SCRIPT, *scripts]
+        self.chrome_args = list(chrome_args)
+        self.command_timeout = command_timeout
+        self.loop = asyncio.new_event_loop()
+        self.thread = threading.Thread(target=self.loop.run_forever, daemon=True)
+        self.process = None
+        self.user_data_dir = None
+        self.opened = 0
+        self.closed = 0
+
+    def start(self):
+        with socket.socket() as probe:
+            probe.bind(('127.0.0.1', 0))
+            port = probe.getsockname()[1]
+        self.user_data_dir = tempfile.mkdtemp(prefix='cdp-renderer-')
+        self.process = subprocess.Popen([
+            self.chrome_binary,
+            '--headless=new',
+            '--no-sandbox',
+            '--disable-dev-shm-usage',
+            '--no-first-run',
+            # Tabs render side by side, so none of them may be treated as hidden and throttled
+            '--disable-background-timer-throttling',
+            '--disable-renderer-backgrounding',
+            '--disable-backgrounding-occluded-windows',
+            f"--remote-debugging-port={port}",
+            f"--user-data-dir={self.user_data_dir}",
+            *self.chrome_args,
+            'about:blank',
+        ], stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+        websocket_url = self.wait_for_devtools(port)
+        self.thread.start()
+        self.call(self.connect(websocket_url))
+        print(f"DevTools renderer: Chrome on port {port}, up to {self.tabs} tabs")
+        return self
+
+    def wait_for_devtools(self, port, timeout=30):
+        """
+        Returns:
+            str: The browser's DevTools websocket URL
+        """
+        deadline = time.monotonic() + timeout
+        while time.monotonic() < deadline:
+            if self.process.poll() is not None:
+                raise RuntimeError(f"Chrome exited with code {self.process.returncode}")
+            try:
+                with urllib.request.urlopen(f"http://127.0.0.1:{port}/json/version", timeout=2) as response:
+                    return json.loads(response.read())['webSocketDebuggerUrl']
+            except OSError:
+                time.sleep(0.1)
+        raise TimeoutError("Chrome's DevTools endpoint never came up")
+
+    def call(self, coroutine, timeout=None):
+        """
+        Run a coroutine on the renderer's event loop and wait for it from any thread.
+
+        Args:
+            timeout (float, optional): Seconds to wait; defaults to the command timeout
+        """
+        future = asyncio.run_coroutine_threadsafe(coroutine, self.loop)
+        try:
+            return future.result(timeout or self.command_timeout)
+        except concurrent.futures.TimeoutError:
+            future.cancel()
+            raise TimeoutError("The DevTools renderer didn't answer in time")
+
+    async def connect(self, websocket_url):
+        self.websocket = await websockets.connect(websocket_url, max_size=None)
+        self.connection = CdpConnection(self.websocket, self.command_timeout)
+        self.idle = asyncio.Queue()
+        self.live = 0
+
+    async def acquire_tab(self):
+        if self.idle.empty() and self.live < self.tabs:
+            self.live += 1
+            try:
+                return await self.open_tab()
+            except Exception:
+                self.live -= 1
+                raise
+        return await self.idle.get()
+
+    async def open_tab(self):
+        target = await self.connection.send('Target.createTarget', {'url': 'about:blank'})
+        attached = await self.connection.send('Target.attachToTarget', {'targetId': target['targetId'], 'flatten': True})
+        tab = CdpTab(self.connection, target['targetId'], attached['sessionId'])
+        await tab.send('Page.enable')
+        for script in self.scripts:
+            await tab.send('Page.addScriptToEvaluateOnNewDocument', {'source': script})
+        self.opened += 1
+        return tab
+
+    async def release_tab(self, tab, healthy):
+        """Blank a tab and put it back, or close it if it failed or is worn out"""
+        tab.renders += 1
+        worn_out = self.max_renders > 0 and tab.renders >= self.max_renders
+        if healthy and not worn_out:
+            try:
+                # A fresh document, so the next render can't see this one's readiness signal
+                await tab.send('Page.navigate', {'url': 'about:blank'})
+                self.idle.put_nowait(tab)
+                return
+            except Exception:
+                pass
+        self.live -= 1
+        self.closed += 1
+        try:
+            await self.connection.send('Target.closeTarget', {'targetId': tab.target_id})
+        except Exception:
+            pass
+
+    def render(self, url):
+        """
+        Returns:
+            tuple: (PNG bytes, comma separated buy IDs)
+
+        Raises:
+            TimeoutError: The page never signalled it was ready
+        """
+        # Every step of a render has its own timeout; this one only catches a wedged event loop
+        return self.call(self.render_async(url), timeout=self.ready_timeout + self.capture_timeout + 4 * self.command_timeout)
+
+    async def render_async(self, url):
+        tab = await self.acquire_tab()
+        healthy = False
+        try:
+            navigation = await tab.send('Page.navigate', {'url': url})
+            if navigation.get('errorText'):
+                # Not a TimeoutError: the page never loaded, which says nothing about the league
+                raise CdpError(f"Could not load {url}: {navigation['errorText']}")
+            ready = await tab.poll(f"(function () {{{READY_SCRIPT}}})()", self.ready_timeout)
+            if ready is None:
+                raise TimeoutError(f"{url} never signalled it was ready")
+            await tab.evaluate(f"document.querySelector({json.dumps(self.button_selector)}).click()")
+            data_url = await tab.poll('window.__blueprintCapture', self.capture_timeout)
+            if data_url is None:
+                raise RuntimeError(f"{url} never exported its PNG")
+            healthy = True
+            return base64.b64decode(data_url.split('base64,', 1)[1]), ready['buyIds']
+        finally:
+            await self.release_tab(tab, healthy)
+
+    def close(self):
+        """Quit Chrome and remove its profile"""
+        if self.thread.is_alive():
+            try:
+                self.call(self.websocket.close())
+            except Exception:
+                pass
+            self.loop.call_soon_threadsafe(self.loop.stop)
+            self.thread.join()
+        if self.process:
+            self.process.terminate()
+            try:
+                self.process.wait(timeout=10)
+            except subprocess.TimeoutExpired:
+                self.process.kill()
+        if self.user_data_dir:
+            shutil.rmtree(self.user_data_dir, ignore_errors=True)
+        print(f"DevTools renderer: opened {self.opened} tabs, closed {self.closed}")
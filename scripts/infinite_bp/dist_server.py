@@ -0,0 +1,57 @@
+import functools
+import os
+import threading
+from http.server import SimpleHTTPRequestHandler, ThreadingHTTPServer
+
+# Vite fingerprints everything under assets/, so those never change
+IMMUTABLE_CACHE = 'public, max-age=31536000, immutable'
+DEFAULT_CACHE = 'public, max-age=86400'
+
+class DistHandler(SimpleHTTPRequestHandler):
+    def __init__(self, *args, base_path='/dynasty-ff/', **kwargs):
+        self.base_path = base_path
+        super().__init__(*args, **kwargs)
+
+    def translate_path(self, path):
+        path = path.split('?', 1)[0].split('#', 1)[0]
+        if path.startswith(self.base_path):
+            path = '/' + path[len(self.base_path):]
+        elif path + '/' == self.base_path:
+            path = '/'
+        return super().translate_path(path)
+
+    def end_headers(self):
+        path = self.path.split('?', 1)[0]
+        self.send_header('Cache-Control', IMMUTABLE_CACHE if '/assets/' in path else DEFAULT_CACHE)
+        super().end_headers()
+
+    def log_message(self, format, *args):
+        pass
+
+class DistServer:
+    def __init__(self, dist_dir='dist', base_path='/dynasty-ff/', port=0):
+        """
+        Serves the built app on loopback so renders load the exact build
+        we're about to ship, without GitHub Pages' latency.
+
+        Args:
+            dist_dir (str): Output of `npm run build`
+            base_path (str): Vite `base` the app was built with
+            port (int): Port to listen on, 0 for any free port
+        """
+        if not os.path.isfile(os.path.join(dist_dir, 'index.html')):
+            raise FileNotFoundError(f"No built app in {dist_dir}, run `npm run build` first")
+        handler = functools.partial(DistHandler, directory=os.path.abspath(dist_dir), base_path=base_path)
+        self.server = ThreadingHTTPServer(('127.0.0.1', port), handler)
+        self.server.daemon_threads = True
+        self.url = f"http://127.0.0.1:{self.server.server_address[1]}{base_path}"
+        self.thread = threading.Thread(target=self.server.serve_forever, daemon=True)
+
+    def start(self):
+        self.thread.start()
+        print(f"Serving built app at {self.url}")
+        return self
+
+    def stop(self):
+        self.server.shutdown()
+        self.server.server_close()
@@ -0,0 +1,161 @@
+import json
+import os
+import re
+import threading
+import uuid
+from datetime import datetime
+
+class RunJournal:
+    def __init__(self, run_id=None, journal_dir='runs'):
+        """
+        Append-only log of every customer's progress through a run, one JSON
+        record per line. Reopening the journal of an earlier run continues it.
+
+        Args:
+            run_id (str, optional): Run to continue, or None to start a new run
+            journal_dir (str): Directory journals are kept in
+        """
+        self.run_id = run_id or f"{datetime.now().strftime('%Y%m%d-%H%M%S')}-{uuid.uuid4().hex[:6]}"
+        os.makedirs(journal_dir, exist_ok=True)
+        self.path = os.path.join(journal_dir, f"{self.run_id}.jsonl")
+        if run_id and not os.path.exists(self.path):
+            raise FileNotFoundError(f"No journal for run {run_id} at {self.path}")
+
+        # item -> latest record for it
+        self.latest = {}
+        if os.path.exists(self.path):
+            with open(self.path, 'r') as file:
+                for line in file:
+                    line = line.strip()
+                    if not line:
+                        continue
+                    try:
+                        record = json.loads(line)
+                    except json.JSONDecodeError:
+                        # A crash can leave the last line half written
+                        continue
+                    self.latest[record['item']] = record
+
+        self.lock = threading.Lock()
+        self.file = open(self.path, 'a')
+
+    def record(self, item, email, stage, **details):
+        """
+        Append a record and flush it to disk.
+
+        Args:
+            item (str): Which blueprint this is, e.g. '12' or 'manual-3'
+            email (str): Customer email
+            stage (str): 'started', 'rendered', 'uploaded', 'emailed' or 'failed'
+            details: Extra fields, e.g. link for 'uploaded' or reason for 'failed'
+        """
+        record = {
+            'ts': datetime.now().isoformat(),
+            'item': item,
+            'email': email,
+            'stage': stage,
+            **details
+        }
+        with self.lock:
+            self.file.write(json.dumps(record) + '\n')
+            self.file.flush()
+            os.fsync(self.file.fileno())
+            self.latest[item] = record
+
+    def stage(self, item):
+        """Latest stage recorded for an item, or None if it hasn't been seen"""
+        record = self.latest.get(item)
+        return record['stage'] if record else None
+
+    def latest_record(self, item):
+        return self.latest.get(item)
+
+    def close(self):
+        with self.lock:
+            self.file.close()
+
+def emailed_files(journal_dir='runs'):
+    """
+    Every (email, Drive file ID) pair any journal in the directory records as
+    emailed, so a new run doesn't email a blueprint another run already sent.
+
+    Returns:
+        set: (email, file ID) pairs
+    """
+    emailed = set()
+    if not os.path.isdir(journal_dir):
+        return emailed
+    for name in os.listdir(journal_dir):
+        if not name.endswith('.jsonl'):
+            continue
+        # item -> file ID of its upload in that run
+        file_ids = {}
+        with open(os.path.join(journal_dir, name), 'r') as file:
+            for line in file:
+                try:
+                    record = json.loads(line)
+                except json.JSONDecodeError:
+                    continue
+                if record.get('file_id'):
+                    file_ids[record['item']] = record['file_id']
+                if record.get('stage') != 'emailed':
+                    continue
+                # Links look like https://drive.google.com/file/d/<id>/view
+                match = re.search(r'/d/([^/?]+)', record.get('link') or '')
+                file_id = match.group(1) if match else file_ids.get(record['item'])
+                if file_id:
+                    emailed.add((record['email'], file_id))
+    return emailed
+
+class BuysLog:
+    def __init__(self, path):
+        """
+        Append-only log of the buys found for each customer. Appending one
+        line per customer keeps writes constant-size; compact() turns the
+        log into the buys JSON files at the end of the run.
+
+        Args:
+            path (str): Log file, appended to if it already exists
+        """
+        self.path = path
+        self.lock = threading.Lock()
+        self.file = open(path, 'a')
+
+    def append(self, email, league_id, user_id, buys):
+        record = {'email': email, 'league_id': league_id, 'user_id': user_id, 'buys': buys}
+        with self.lock:
+            self.file.write(json.dumps(record) + '\n')
+            self.file.flush()
+
+    def compact(self):
+        """
+        Write email_to_buys.json, league_id_to_buys.json and user_id_to_buys.json
+        from the log, later records winning over earlier ones.
+        """
+        email_to_buys = {}
+        league_id_to_buys = {}
+        user_id_to_buys = {}
+        with self.lock:
+            self.file.flush()
+            with open(self.path, 'r') as file:
+                for line in file:
+                    try:
+                        record = json.loads(line)
+                    except json.JSONDecodeError:
+                        continue
+                    email_to_buys[record['email']] = record['buys']
+                    league_id_to_buys[record['league_id']] = record['buys']
+                    if record['user_id']:
+                        user_id_to_buys[record['user_id']] = record['buys']
+
+        with open("email_to_buys.json", "w") as json_file:
+            json.dump(email_to_buys, json_file, indent=4)
+        with open("league_id_to_buys.json", "w") as json_file:
+            json.dump(league_id_to_buys, json_file, indent=4)
+        with open("user_id_to_buys.json", "w") as json_file:
+            json.dump(user_id_to_buys, json_file, indent=4)
+        print(f"Wrote buys for {len(email_to_buys)} customers")
+
+    def close(self):
+        with self.lock:
+            self.file.close()
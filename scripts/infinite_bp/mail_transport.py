@@ -0,0 +1,218 @@
+import smtplib
+import queue
+import threading
+import logging
+
+# Errors after which the session is gone and has to be reopened
+DISCONNECT_ERRORS = (smtplib.SMTPServerDisconnected, smtplib.SMTPConnectError, ConnectionError, TimeoutError)
+# Permanent reply text that still means the account is out of sends, not that the message was refused
+QUOTA_REPLY_MARKERS = ('5.4.5', 'quota', 'sending limit', 'rate limit')
+
+def is_quota_error(error):
+    """
+    Whether an SMTP reply means the account hit the provider's sending
+    limit, as opposed to the provider refusing this one message.
+    """
+    if not isinstance(error, smtplib.SMTPResponseException):
+        return False
+    # Temporary replies that outlived the email retries are most likely rate limiting
+    if 400 <= error.smtp_code < 500:
+        return True
+    text = error.smtp_error.decode(errors='replace') if isinstance(error.smtp_error, bytes) else str(error.smtp_error)
+    return any(marker in text.lower() for marker in QUOTA_REPLY_MARKERS)
+
+class SmtpTransport:
+    def __init__(self, smtp_server, smtp_port, sender_email, sender_password, pool_size=1):
+        """
+        Keep authenticated SMTP sessions open across messages instead of
+        paying connect + STARTTLS + login for every recipient.
+
+        Args:
+            smtp_server (str): SMTP host
+            smtp_port (int): SMTP port
+            sender_email (str): Account to log in as
+            sender_password (str): Password for the account
+            pool_size (int): Maximum number of sessions sending at once
+        """
+        self.smtp_server = smtp_server
+        self.smtp_port = smtp_port
+        self.sender_email = sender_email
+        self.sender_password = sender_password
+        self.slots = threading.BoundedSemaphore(pool_size)
+        # Most recently used session first, since it's the least likely to have timed out
+        self.idle = queue.LifoQueue()
+        self.logins = 0
+        self.sent = 0
+        self.lock = threading.Lock()
+
+    def connect(self):
+        server = smtplib.SMTP(self.smtp_server, self.smtp_port, timeout=60)
+        server.starttls()
+        server.login(self.sender_email, self.sender_password)
+        with self.lock:
+            self.logins += 1
+        return server
+
+    def send(self, msg, attempts=2):
+        """
+        Send a message on a pooled session, reconnecting if the server
+        dropped it.
+
+        Args:
+            msg (email.message.Message): The message to send
+            attempts (int): Connections to try before giving up
+        """
+        with self.slots:
+            try:
+                server = self.idle.get_nowait()
+            except queue.Empty:
+                server = None
+            for attempt in range(attempts):
+                try:
+                    if server is None:
+                        server = self.connect()
+                    server.send_message(msg)
+                    break
+                except DISCONNECT_ERRORS as e:
+                    print(f"SMTP session dropped ({str(e)}), reconnecting...")
+                    self.quit(server)
+                    server = None
+                    if attempt == attempts - 1:
+                        raise
+                except smtplib.SMTPException:
+                    # The server rejected this message but the session may still be usable
+                    if server is not None and self.reset(server):
+                        self.idle.put(server)
+                    else:
+                        self.quit(server)
+                    raise
+            self.idle.put(server)
+            with self.lock:
+                self.sent += 1
+
+    def reset(self, server):
+        try:
+            server.rset()
+            return True
+        except Exception:
+            return False
+
+    def quit(self, server):
+        if server is None:
+            return
+        try:
+            server.quit()
+        except Exception:
+            logging.debug("SMTP session already closed", exc_info=True)
+
+    def close(self):
+        """Log out of every idle session"""
+        while True:
+            try:
+                self.quit(self.idle.get_nowait())
+            except queue.Empty:
+                break
+        print(f"SMTP: sent {self.sent} messages over {self.logins} logins")
+
+class SenderAccount:
+    def __init__(self, email, password, smtp_server, smtp_port, daily_quota=None, weight=1, pool_size=1):
+        """
+        One mailbox emails can be sent from, with its own sessions and stats.
+
+        Args:
+            email (str): Account address, also used as the From header
+            password (str): Password for the account
+            smtp_server (str): SMTP host
+            smtp_port (int): SMTP port
+            daily_quota (int, optional): Account-specific quota, else the scheduler default
+            weight (int): Share of recipients relative to the other accounts
+            pool_size (int): Maximum number of sessions sending at once
+        """
+        self.email = email
+        self.daily_quota = daily_quota
+        self.weight = weight
+        self.transport = SmtpTransport(smtp_server, smtp_port, email, password, pool_size=pool_size)
+        self.current_weight = 0
+        self.sent = 0
+        self.deferred = 0
+        self.failed = 0
+
+def parse_sender_accounts(value):
+    """
+    Parse the sender_accounts config value.
+
+    Accepts either a list of {email, password, daily_quota, weight} mappings or
+    a string of comma-separated email:password[:daily_quota[:weight]] entries.
+
+    Returns:
+        list: One dict per account
+    """
+    if not value:
+        return []
+    if isinstance(value, list):
+        return [dict(entry) for entry in value]
+    accounts = []
+    for entry in value.split(','):
+        parts = [part.strip() for part in entry.split(':')]
+        if len(parts) < 2:
+            raise ValueError(f"sender_accounts entry must be email:password[:daily_quota[:weight]], got {entry!r}")
+        account = {'email': parts[0], 'password': parts[1]}
+        if len(parts) > 2 and parts[2]:
+            account['daily_quota'] = int(parts[2])
+        if len(parts) > 3 and parts[3]:
+            account['weight'] = int(parts[3])
+        accounts.append(account)
+    return accounts
+
+class AccountRouter:
+    def __init__(self, accounts, scheduler):
+        """
+        Spread recipients over sender accounts by smooth weighted round-robin,
+        skipping accounts with no quota left. A recipient keeps the same
+        account across retries while that account still has quota.
+
+        Args:
+            accounts (list): SenderAccounts to send from
+            scheduler (EmailScheduler): Tracks each account's remaining quota
+        """
+        self.accounts = accounts
+        self.by_email = {account.email: account for account in accounts}
+        self.scheduler = scheduler
+        self.assignments = {}
+        self.lock = threading.Lock()
+
+    def pin(self, recipient, account_email):
+        """Keep a recipient on the account an earlier run assigned it"""
+        with self.lock:
+            if account_email in self.by_email:
+                self.assignments[recipient] = self.by_email[account_email]
+
+    def assign(self, recipient):
+        """
+        Returns:
+            SenderAccount: Account to email recipient from, or None if every account is out of quota
+        """
+        with self.lock:
+            account = self.assignments.get(recipient)
+            if account and self.scheduler.remaining(account.email) > 0:
+                return account
+            candidates = [a for a in self.accounts if self.scheduler.remaining(a.email) > 0]
+            if not candidates:
+                return account
+            total = sum(a.weight for a in candidates)
+            for candidate in candidates:
+                candidate.current_weight += candidate.weight
+            best = max(candidates, key=lambda a: a.current_weight)
+            best.current_weight -= total
+            self.assignments[recipient] = best
+            return best
+
+    def print_stats(self):
+        print("\nSender accounts:")
+        for account in self.accounts:
+            print(f"{account.email}: sent {account.sent}, deferred {account.deferred}, failed {account.failed}, "
+                  f"{self.scheduler.remaining(account.email)} left in quota")
+
+    def close(self):
+        for account in self.accounts:
+            account.transport.close()
@@ -3,7 +3,7 @@ import smtplib
 from email.mime.multipart import MIMEMultipart
 from email.mime.image import MIMEImage
 from email.mime.text import MIMEText
-from datetime import datetime
+from datetime import datetime, timedelta
 import yaml
 import os
 import time
@@ -12,13 +12,148 @@ from selenium.webdriver.common.by import By
 from selenium.webdriver.support.ui import WebDriverWait
 from selenium.webdriver.support import expected_conditions as EC
 from selenium.common.exceptions import TimeoutException
-from uploader import GoogleDriveUploader
+from uploader import GoogleDriveUploader, UploadEngine
+from journal import RunJournal, BuysLog, emailed_files
+from shard_planner import get_chunk_indices, load_shard
+from render_cache import RenderCache, default_data_version
+from sleeper_proxy import SleeperProxy, CHROME_ARGS as SLEEPER_PROXY_CHROME_ARGS
+from dist_server import DistServer
+from mail_transport import SenderAccount, AccountRouter, parse_sender_accounts, is_quota_error
+from retry import RetryPolicy, PermanentError, is_transient
+from pipeline import Stage, Pipeline
+from png_optimizer import PngOptimizer
+from page_scripts import CAPTURE_SCRIPT, READY_SCRIPT
+from preflight import Preflight
+from cdp_renderer import CdpRenderer
+from run_report import RunMetrics
 import argparse
-import uuid
 import logging
+import queue
+import threading
+import base64
+import urllib.request
+
+DEFAULT_BASE_URL = 'https://rrout2.github.io/dynasty-ff/'
+
+class PooledDriver:
+    def __init__(self, driver, download_dir):
+        """
+        A warm Chrome driver owned by a DriverPool.
+
+        Args:
+            driver (webdriver.Chrome): The live driver
+            download_dir (str): Directory Chrome saves downloads into
+        """
+        self.driver = driver
+        self.download_dir = download_dir
+        self.renders = 0
+
+class DriverPool:
+    def __init__(self, driver_factory, download_dir, size=1, max_renders=50, keep_page=False):
+        """
+        Keep up to `size` headless Chrome instances alive for the whole run so
+        each blueprint doesn't pay a browser + chromedriver cold start.
+
+        Args:
+            driver_factory (callable): Takes a download dir, returns a new driver
+            download_dir (str): Parent directory; each driver downloads into its own subdirectory
+            size (int): Maximum number of live drivers
+            max_renders (int): Recycle a driver after this many renders (0 = never)
+            keep_page (bool): Leave the loaded app in place between renders
+                instead of clearing it, for in-app navigation
+        """
+        self.driver_factory = driver_factory
+        self.download_dir = download_dir
+        self.size = size
+        self.max_renders = max_renders
+        self.keep_page = keep_page
+        self.idle = queue.Queue()
+        self.live = 0
+        self.created = 0
+        self.recycled = 0
+        self.lock = threading.Lock()
+
+    def acquire(self):
+        """Get an idle driver, starting a new one if the pool isn't full yet"""
+        try:
+            return self.idle.get_nowait()
+        except queue.Empty:
+            pass
+        with self.lock:
+            can_create = self.live < self.size
+            if can_create:
+                self.live += 1
+        if not can_create:
+            return self.idle.get()
+        with self.lock:
+            self.created += 1
+            download_dir = os.path.join(self.download_dir, f"driver-{self.created}")
+        os.makedirs(download_dir, exist_ok=True)
+        try:
+            driver = self.driver_factory(download_dir)
+        except Exception:
+            with self.lock:
+                self.live -= 1
+            raise
+        return PooledDriver(driver, download_dir)
+
+    def release(self, pooled):
+        """
+        Return a driver to the pool. The driver is reset and health-checked
+        first, and quit instead if it crashed or has hit max_renders.
+        """
+        pooled.renders += 1
+        worn_out = self.max_renders > 0 and pooled.renders >= self.max_renders
+        if worn_out or not self.reset(pooled.driver):
+            self.discard(pooled)
+            return
+        self.idle.put(pooled)
+
+    def discard(self, pooled):
+        """Quit a driver and free its slot so the next acquire starts a fresh one"""
+        try:
+            pooled.driver.quit()
+        except Exception:
+            logging.exception("Failed to quit driver")
+        with self.lock:
+            self.live -= 1
+            self.recycled += 1
+
+    def reset(self, driver):
+        """
+        Clear per-customer browser state and check the driver still responds.
+
+        Returns:
+            bool: Whether the driver is healthy and can be reused
+        """
+        try:
+            handles = driver.window_handles
+            for handle in handles[1:]:
+                driver.switch_to.window(handle)
+                driver.close()
+            driver.switch_to.window(handles[0])
+            if self.keep_page:
+                return driver.execute_script('return 1') == 1
+            driver.execute_script("window.localStorage.clear(); window.sessionStorage.clear();")
+            driver.delete_all_cookies()
+            driver.get('about:blank')
+            return driver.execute_script('return 1') == 1
+        except Exception as e:
+            print(f"Recycling unhealthy driver: {str(e)}")
+            return False
+
+    def close(self):
+        """Quit every idle driver"""
+        while True:
+            try:
+                pooled = self.idle.get_nowait()
+            except queue.Empty:
+                break
+            self.discard(pooled)
+        print(f"Driver pool: started {self.created}, recycled {self.recycled}")
 
 class ImageEmailSender:
-    def __init__(self, send_email=False, config_path='config.yaml'):
+    def __init__(self, send_email=False, config_path='config.yaml', max_renders_per_driver=50, workers=1, capture='download', smtp_sessions=1, sleeper_proxy=None, base_url=DEFAULT_BASE_URL, render_mode='reload', renderer=None, metrics=None):
         # Example config
         # email_list: user1@example.com,user2@example.com
         # league_id_list: 1180303064879046656,1180303064879046656
@@ -27,6 +162,7 @@ class ImageEmailSender:
         # smtp_port: 587
         # sender_email: your-email@gmail.com
         # sender_password: your-app-password
+        # sender_accounts: a@gmail.com:app-password:500:2,b@gmail.com:app-password (optional, replaces sender_email/sender_password)
         # disallowed_buys: 1-2-3-4,7-4-5-6
         # Load configuration
         script_dir = os.path.dirname(os.path.abspath(__file__))
@@ -99,18 +235,51 @@ class ImageEmailSender:
 
         self.smtp_server = config['smtp_server']
         self.smtp_port = int(config['smtp_port']) if config['smtp_port'] != None else None
+        self.accounts = []
         if send_email:
-            self.sender_email = config['sender_email']
-            self.sender_password = config['sender_password']
+            accounts = parse_sender_accounts(config.get('sender_accounts'))
+            if not accounts:
+                accounts = [{'email': config['sender_email'], 'password': config['sender_password']}]
+            self.accounts = [
+                SenderAccount(
+                    account['email'],
+                    account['password'],
+                    self.smtp_server,
+                    self.smtp_port,
+                    daily_quota=account.get('daily_quota'),
+                    weight=account.get('weight', 1),
+                    pool_size=smtp_sessions
+                )
+                for account in accounts
+            ]
+            self.sender_email = self.accounts[0].email
 
         self.download_button_selector = '#root > button'
-        self.buy_ids_selector = '#root > span'
+        # 'download' saves the PNG through Chrome, 'memory' reads its bytes from the page
+        self.capture = capture
+        # SleeperProxy the browsers send their Sleeper API calls through, if any
+        self.sleeper_proxy = sleeper_proxy
+        # Where the app is served from, e.g. GitHub Pages or a local DistServer
+        self.base_url = base_url
+        # 'reload' loads every URL from scratch, 'spa' loads the app once per
+        # driver and then only changes the hash route
+        self.render_mode = render_mode
+        # Backend with a render(url) -> (PNG bytes, buy IDs) method used
+        # instead of the Selenium driver pool, e.g. a CdpRenderer
+        self.renderer = renderer
+        # Per-stage timings for the run report
+        self.metrics = metrics or RunMetrics()
 
 
         # Create output directory if it doesn't exist
         self.download_dir = os.path.join(os.getcwd(), 'downloads')
         os.makedirs(self.download_dir, exist_ok=True)
 
+        self.driver_pool = DriverPool(self.setup_driver, self.download_dir, size=workers, max_renders=max_renders_per_driver, keep_page=render_mode == 'spa')
+
+        # Guards the buys maps and fail lists when rendering with several workers
+        self.lock = threading.Lock()
+
         self.email_to_buys = {}
         self.league_id_to_buys = {}
         self.user_id_to_buys = {}
@@ -118,7 +287,7 @@ class ImageEmailSender:
         self.fails = []
         self.fail_indices = []
 
-    def setup_driver(self):
+    def setup_driver(self, download_dir=None):
         """Setup Chrome driver with custom download settings"""
         chrome_options = webdriver.ChromeOptions()
 
@@ -126,33 +295,79 @@ class ImageEmailSender:
         chrome_options.add_argument('--headless')
         chrome_options.add_argument('--no-sandbox')
         chrome_options.add_argument('--disable-dev-shm-usage')
+        if self.sleeper_proxy:
+            for arg in SLEEPER_PROXY_CHROME_ARGS:
+                chrome_options.add_argument(arg)
 
         # Set download preferences
         prefs = {
-            "download.default_directory": self.download_dir,
+            "download.default_directory": download_dir or self.download_dir,
             "download.prompt_for_download": False,
             "download.directory_upgrade": True,
             "safebrowsing.enabled": True
         }
         chrome_options.add_experimental_option("prefs", prefs)
 
+        # Surface DevTools download events through the performance log
+        chrome_options.set_capability('goog:loggingPrefs', {'performance': 'ALL'})
+
         # Initialize the driver
         driver = webdriver.Chrome(options=chrome_options)
+
+        # Name each download by its DevTools guid so we know exactly which file a click produced
+        driver.execute_cdp_cmd('Browser.setDownloadBehavior', {
+            'behavior': 'allowAndName',
+            'downloadPath': download_dir or self.download_dir,
+            'eventsEnabled': True
+        })
+
+        if self.sleeper_proxy:
+            driver.execute_cdp_cmd('Page.addScriptToEvaluateOnNewDocument', {
+                'source': self.sleeper_proxy.rewrite_script()
+            })
         return driver
 
-    def wait_for_download(self, timeout=60):
-        """Wait for download to complete"""
-        time.sleep(5)
-        seconds = 0
-        dl_wait = True
-        while dl_wait and seconds < timeout:
-            time.sleep(1)
-            dl_wait = False
-            for fname in os.listdir(self.download_dir):
-                if fname.endswith('.crdownload'):
-                    dl_wait = True
-            seconds += 1
-        return seconds < timeout
+    def wait_for_download(self, driver, download_dir, timeout=60):
+        """
+        Wait for the download started by the last click to complete, driven by
+        the downloadWillBegin/downloadProgress events Chrome reports.
+
+        Args:
+            driver (webdriver.Chrome): Driver that started the download
+            download_dir (str): Directory the driver downloads into
+            timeout (int): Seconds to wait before giving up
+
+        Returns:
+            str: Path to the downloaded PNG, or None if it timed out
+        """
+        deadline = time.monotonic() + timeout
+        guid = None
+        suggested_filename = None
+        while time.monotonic() < deadline:
+            for entry in driver.get_log('performance'):
+                message = json.loads(entry['message'])['message']
+                method = message.get('method', '')
+                params = message.get('params', {})
+                if method.endswith('.downloadWillBegin'):
+                    guid = params['guid']
+                    suggested_filename = params.get('suggestedFilename')
+                elif method.endswith('.downloadProgress') and params.get('guid') == guid:
+                    if params['state'] == 'canceled':
+                        raise Exception("Download was canceled")
+                    if params['state'] == 'completed':
+                        return self.claim_download(download_dir, guid, suggested_filename)
+            time.sleep(0.05)
+        return None
+
+    def claim_download(self, download_dir, guid, suggested_filename):
+        """Give a finished download a .png name, whichever way Chrome saved it"""
+        path = os.path.join(download_dir, guid)
+        if not os.path.exists(path):
+            # Download behavior wasn't applied, so Chrome used the page's file name
+            path = os.path.join(download_dir, suggested_filename)
+        png_path = os.path.join(download_dir, f"{guid}.png")
+        os.replace(path, png_path)
+        return png_path
 
     def construct_url(self, idx, manual=False):
         """
@@ -163,129 +378,220 @@ class ImageEmailSender:
             manual (bool): Whether to use manual URL
         """
         if manual:
-            return f"https://rrout2.github.io/dynasty-ff/#/infinite?{self.manual_url_list[idx]}"
+            return f"{self.base_url}#/infinite?{self.manual_url_list[idx]}"
         disallowed_buys = str(self.disallowed_buys[idx])
         if disallowed_buys == 'None':
             disallowed_buys = ''
         else:
             disallowed_buys = disallowed_buys.replace('-', ',')
         if len(self.team_id_list) > 0:
-            return f"https://rrout2.github.io/dynasty-ff/#/weekly?leagueId={self.league_id_list[idx]}&teamId={self.team_id_list[idx]}&disallowedBuys={disallowed_buys}"
+            return f"{self.base_url}#/weekly?leagueId={self.league_id_list[idx]}&teamId={self.team_id_list[idx]}&disallowedBuys={disallowed_buys}"
         else:
-            return f"https://rrout2.github.io/dynasty-ff/#/weekly?leagueId={self.league_id_list[idx]}&userId={self.user_id_list[idx]}&disallowedBuys={disallowed_buys}"
+            return f"{self.base_url}#/weekly?leagueId={self.league_id_list[idx]}&userId={self.user_id_list[idx]}&disallowedBuys={disallowed_buys}"
 
     def download_image(self, idx, manual=False):
-        """Navigate to website and click download button"""
-        driver = self.setup_driver()
-        try:
-            # Navigate to the website
-            url = self.construct_url(idx, manual)
-            print(f"Navigating to {url}")
-            driver.get(url)
-            
-            time.sleep(2)
-            # Wait for button to exist
-            WebDriverWait(driver, 30).until(
-                EC.presence_of_element_located((By.CSS_SELECTOR, self.download_button_selector))
-            )
+        """
+        Render a blueprint with the configured backend and record its buys
 
-            # Wait for loading to finish
-            WebDriverWait(driver, 30).until(
-                EC.invisibility_of_element_located((By.CSS_SELECTOR, '.loading'))
-            )
+        Returns:
+            str or bytes: Path to the downloaded PNG, or the PNG bytes when
+                capturing in memory
 
-            # Wait for and click the download button
-            button = WebDriverWait(driver, 20).until(
-                EC.element_to_be_clickable((By.CSS_SELECTOR, self.download_button_selector))
-            )
-            time.sleep(0.2)
-            print("Clicking download button...")
-            button.click()
+        Raises:
+            PermanentError: The page never got ready because the league doesn't exist
+        """
+        url = self.construct_url(idx, manual)
+        item = f"manual-{idx}" if manual else str(idx)
+        print(f"Navigating to {url}")
+        try:
+            if self.renderer:
+                with self.metrics.timed(item, 'browser'):
+                    image, buy_ids = self.renderer.render(url)
+                print(f"Captured image ({len(image)} bytes)")
+            else:
+                image, buy_ids = self.render_with_selenium(url, item)
+        except TimeoutError as e:
+            if not manual and not self.league_exists(self.league_id_list[idx]):
+                raise PermanentError(f"League {self.league_id_list[idx]} does not exist") from e
+            raise
+
+        if not manual:
+            self.store_buys(idx, buy_ids)
+            print(f"Buy IDs: {buy_ids}")
+        return image
+
+    def render_with_selenium(self, url, item=None):
+        """
+        Navigate a pooled browser to the blueprint and click its download button
 
-            # Wait for download to complete
-            if not self.wait_for_download():
-                raise TimeoutException("Download timed out")
+        Args:
+            url (str): Blueprint URL
+            item (str, optional): Journal item to attribute the timings to
 
-            # Get the latest downloaded file
-            downloaded_files = os.listdir(self.download_dir)
-            if not downloaded_files:
-                raise Exception("No files found in download directory")
+        Returns:
+            tuple: (PNG path or bytes, comma separated buy IDs)
 
-            latest_file = max([os.path.join(self.download_dir, f) for f in downloaded_files if f.endswith('.png')],
-                            key=os.path.getctime)
-            print(f"Downloaded file: {latest_file}")
+        Raises:
+            TimeoutError: The page never signalled it was ready
+        """
+        with self.metrics.timed(item, 'driver'):
+            pooled = self.driver_pool.acquire()
+        driver = pooled.driver
+        try:
+            with self.metrics.timed(item, 'navigate'):
+                if self.render_mode == 'spa' and driver.current_url.startswith(self.base_url):
+                    self.navigate_in_app(driver, url)
+                else:
+                    driver.get(url)
+
+            try:
+                with self.metrics.timed(item, 'ready'):
+                    ready = self.wait_until_ready(driver)
+            except TimeoutException as e:
+                raise TimeoutError(f"{url} never signalled it was ready") from e
+            button = driver.find_element(By.CSS_SELECTOR, self.download_button_selector)
+            with self.metrics.timed(item, 'capture'):
+                if self.capture == 'memory':
+                    image = self.capture_image(driver, button)
+                    print(f"Captured image ({len(image)} bytes)")
+                else:
+                    # Drop page-load events so only this click's download is seen
+                    driver.get_log('performance')
+                    print("Clicking download button...")
+                    button.click()
+
+                    # Wait for download to complete
+                    image = self.wait_for_download(driver, pooled.download_dir)
+                    if not image:
+                        raise TimeoutException("Download timed out")
+                    print(f"Downloaded file: {image}")
+
+            return image, ready['buyIds']
 
-            if not manual:
-                self.store_buy_ids(driver, idx)
-                print(f"Buy IDs: {self.email_to_buys[self.email_list[idx]]}")
+        finally:
+            self.driver_pool.release(pooled)
 
-            return latest_file
-        
-        except Exception as e:
-            print(f"\nAn error occurred: {str(e)}")
-            logging.exception("Exception occurred")
-            return None
+    def league_exists(self, league_id):
+        """
+        Ask Sleeper whether a league exists; errors count as existing so only
+        a definite answer marks a render as permanently failed
+        """
+        try:
+            with urllib.request.urlopen(f"https://api.sleeper.app/v1/league/{league_id}", timeout=10) as response:
+                return json.loads(response.read() or b'null') is not None
+        except Exception:
+            return True
 
-        finally:
-            driver.quit()
+    def navigate_in_app(self, driver, url, timeout=30):
+        """
+        Switch the already loaded app to another blueprint by changing only
+        the hash route, then wait for the previous page to unmount
+        """
+        route = url.split('#', 1)[1]
+        if driver.execute_script('return window.location.hash') == f"#{route}":
+            return
+        previous = driver.find_elements(By.CSS_SELECTOR, self.download_button_selector)
+        # RemountOnSearch remounts the page for every bump, even when only teamId changes
+        driver.execute_script('window.__blueprintNavigation = (window.__blueprintNavigation || 0) + 1; window.location.hash = arguments[0]', route)
+        if previous:
+            WebDriverWait(driver, timeout).until(EC.staleness_of(previous[0]))
+
+    def wait_until_ready(self, driver, timeout=60):
+        """
+        Wait for the page to signal that the blueprint is fully rendered
 
-    def store_buy_ids(self, driver, idx):
-        WebDriverWait(driver, 20).until(
-            EC.presence_of_element_located((By.CSS_SELECTOR, self.buy_ids_selector))
+        Returns:
+            dict: The page's readiness payload, with the blueprint's buyIds
+        """
+        return WebDriverWait(driver, timeout, poll_frequency=0.05).until(
+            lambda d: d.execute_script(READY_SCRIPT)
         )
 
-        buy_ids = driver.find_element(By.CSS_SELECTOR, self.buy_ids_selector).text
-        self.email_to_buys[self.email_list[idx]] = buy_ids
-        self.league_id_to_buys[self.league_id_list[idx]] = buy_ids
-        if len(self.user_id_list) > 0:
-            self.user_id_to_buys[self.user_id_list[idx]] = buy_ids
+    def capture_image(self, driver, button, timeout=60):
+        """
+        Click the download button and read the exported PNG from the page
 
-    def send_image_directly(self, recipient_email, image_path):
+        Returns:
+            bytes: The PNG the page would have downloaded
+        """
+        driver.execute_script(CAPTURE_SCRIPT)
+        print("Clicking download button...")
+        button.click()
+        data_url = WebDriverWait(driver, timeout).until(
+            lambda d: d.execute_script('return window.__blueprintCapture')
+        )
+        return base64.b64decode(data_url.split('base64,', 1)[1])
+
+    def store_buys(self, idx, buy_ids):
+        with self.lock:
+            self.email_to_buys[self.email_list[idx]] = buy_ids
+            self.league_id_to_buys[self.league_id_list[idx]] = buy_ids
+            if len(self.user_id_list) > 0:
+                self.user_id_to_buys[self.user_id_list[idx]] = buy_ids
+
+    def record_fail(self, email, idx):
+        with self.lock:
+            self.fails.append(email)
+            # Emails queued by earlier invocations have no index in this one
+            if idx is not None:
+                self.fail_indices.append(idx)
+            print(f"failed indices: {self.fail_indices}")
+
+    def send_image_directly(self, recipient_email, image, file_name=None, account=None):
         """
         Send email with image attachment
 
         Args:
             recipient_email (str): Email address of the recipient
-            image_path (str): Path to the image file
+            image (str or bytes): Path to the image file, or its PNG bytes
+            file_name (str, optional): Attachment name, defaults to the file's name
+            account (SenderAccount, optional): Account to send from, defaults to the first
         """
+        account = account or self.accounts[0]
         msg = MIMEMultipart()
-        msg['From'] = self.sender_email
+        msg['From'] = account.email
         msg['To'] = recipient_email
         msg['Subject'] = f"Your Monthly Blueprint - {datetime.now().strftime('%B %Y')}"
 
         body = f"Attached is your Infinite Blueprint for {datetime.now().strftime('%B')}. Feel free to ask any questions in the Domain discord. Enjoy!"
         msg.attach(MIMEText(body, 'plain'))
 
-        with open(image_path, 'rb') as img_file:
-            img = MIMEImage(img_file.read())
-            img.add_header('Content-Disposition', 'attachment', filename=os.path.basename(image_path))
-            msg.attach(img)
+        if isinstance(image, bytes):
+            img = MIMEImage(image, 'png')
+            file_name = file_name or 'blueprint.png'
+        else:
+            with open(image, 'rb') as img_file:
+                img = MIMEImage(img_file.read())
+            file_name = file_name or os.path.basename(image)
+        img.add_header('Content-Disposition', 'attachment', filename=file_name)
+        msg.attach(img)
 
-        with smtplib.SMTP(self.smtp_server, self.smtp_port) as server:
-            server.starttls()
-            server.login(self.sender_email, self.sender_password)
-            server.send_message(msg)
+        account.transport.send(msg)
 
-    def send_email_link(self, recipient_email, drive_link):
+    def send_email_link(self, recipient_email, drive_link, account=None):
         """
         Send email with drive link
 
         Args:
             recipient_email (str): Email address of the recipient
             drive_link (str): Google Drive link to the image
+            account (SenderAccount, optional): Account to send from, defaults to the first
         """
+        account = account or self.accounts[0]
         msg = MIMEMultipart()
-        msg['From'] = self.sender_email
+        msg['From'] = account.email
         msg['To'] = recipient_email
         msg['Subject'] = f"Your Monthly Blueprint - {datetime.now().strftime('%B %Y')}"
 
         body = f"Attached is your Infinite Blueprint for {datetime.now().strftime('%B')}. Feel free to ask any questions in the Domain discord. Enjoy!\n\n" + drive_link
         msg.attach(MIMEText(body, 'plain'))
 
-        with smtplib.SMTP(self.smtp_server, self.smtp_port) as server:
-            server.starttls()
-            server.login(self.sender_email, self.sender_password)
-            server.send_message(msg)
+        account.transport.send(msg)
+
+def discard_image(image):
+    """Delete a rendered image once it's no longer needed; in-memory images just get dropped"""
+    if isinstance(image, str):
+        os.remove(image)
 
 def censor_email(email):
     parts = email.split('@')
@@ -293,69 +599,476 @@ def censor_email(email):
     local_part = local_part[:2] + '***' + local_part[-2:]
     return f"{local_part}@{parts[1]}"
 
-def get_chunk_indices(data_list, chunk_index, number_of_chunks):
-    """
-    Calculates the start and end indices (exclusive) for a specific chunk
-    of a given list, distributing the data as evenly as possible.
-
-    Args:
-        data_list: The list of data to be chunked.
-        chunk_index: The 1-indexed number of the chunk to retrieve (e.g., 1, 2, 3...).
-        number_of_chunks: The total number of chunks to divide the list into.
-
-    Returns:
-        A tuple (start_index, end_index) where end_index is exclusive.
-
-    Raises:
-        ValueError: If chunk_index or number_of_chunks are invalid (e.g., out of range).
-    """
-    list_length = len(data_list)
-
-    # --- 1. Validation ---
-    if number_of_chunks <= 0:
-        raise ValueError("number_of_chunks must be a positive integer.")
-    if chunk_index <= 0 or chunk_index > number_of_chunks:
-        raise ValueError(
-            f"chunk_index ({chunk_index}) must be between 1 and number_of_chunks ({number_of_chunks})."
-        )
-    if list_length == 0:
-        return (0, 0)
+class EmailScheduler:
+    def __init__(self, path='email_schedule.jsonl', daily_quota=500, per_minute=20):
+        """
+        Keep sends under the provider's daily quota and a per-minute rate.
+        Emails that don't fit in today's quota are queued in the schedule file
+        and delivered first by the next invocation.
 
-    # --- 2. Calculate Base Distribution Parameters ---
-    # base_size is the minimum size of any chunk (using integer division)
-    base_size = list_length // number_of_chunks
-    # extra_elements is the number of chunks that will be one element larger
-    extra_elements = list_length % number_of_chunks
+        Args:
+            path (str): Append-only schedule file, kept between invocations
+            daily_quota (int): Most emails an account may send in any 24 hours
+            per_minute (int): Most emails an account may send in any minute (0 = no limit)
+        """
+        self.path = path
+        self.daily_quota = daily_quota
+        # account -> quota overriding daily_quota
+        self.quotas = {}
+        self.per_minute = per_minute
+        self.lock = threading.Lock()
+        # account -> send times within the last 24 hours
+        self.sends = {}
+        # account -> send times within the last minute
+        self.recent = {}
+        # account -> sends reserved but not yet finished
+        self.reserved = {}
+        # email -> queued delivery
+        self.outstanding = {}
+        self.exhausted = set()
+
+        cutoff = datetime.now() - timedelta(days=1)
+        if os.path.exists(path):
+            with open(path, 'r') as file:
+                for line in file:
+                    try:
+                        event = json.loads(line)
+                    except json.JSONDecodeError:
+                        continue
+                    if event['event'] == 'sent' and datetime.fromisoformat(event['ts']) > cutoff:
+                        self.sends.setdefault(event['account'], []).append(datetime.fromisoformat(event['ts']))
+                    elif event['event'] == 'deferred':
+                        self.outstanding[event['email']] = event
+                    elif event['event'] in ('delivered', 'dropped'):
+                        self.outstanding.pop(event['email'], None)
+
+        # Compact the file down to what still matters
+        with open(path, 'w') as file:
+            for account, times in self.sends.items():
+                for ts in times:
+                    file.write(json.dumps({'event': 'sent', 'account': account, 'ts': ts.isoformat()}) + '\n')
+            for event in self.outstanding.values():
+                file.write(json.dumps(event) + '\n')
+        self.file = open(path, 'a')
+
+    def write(self, event):
+        self.file.write(json.dumps(event) + '\n')
+        self.file.flush()
+
+    def remaining(self, account):
+        """Sends left for an account in the current 24 hour window"""
+        with self.lock:
+            return self.remaining_locked(account)
+
+    def remaining_locked(self, account):
+        if account in self.exhausted:
+            return 0
+        cutoff = datetime.now() - timedelta(days=1)
+        times = [ts for ts in self.sends.get(account, []) if ts > cutoff]
+        self.sends[account] = times
+        return self.quotas.get(account, self.daily_quota) - len(times) - self.reserved.get(account, 0)
+
+    def set_quota(self, account, daily_quota):
+        with self.lock:
+            self.quotas[account] = daily_quota
+
+    def reserve(self, account):
+        """
+        Claim one send for an account, waiting for the per-minute rate if needed.
 
-    # --- 3. Determine Start Index (Inclusive) ---
+        Returns:
+            bool: False if the daily quota is used up and the email should be deferred
+        """
+        while True:
+            with self.lock:
+                if self.remaining_locked(account) <= 0:
+                    return False
+                now = time.monotonic()
+                recent = [t for t in self.recent.get(account, []) if now - t < 60]
+                self.recent[account] = recent
+                if self.per_minute <= 0 or len(recent) < self.per_minute:
+                    recent.append(now)
+                    self.reserved[account] = self.reserved.get(account, 0) + 1
+                    return True
+                wait = 60 - (now - recent[0])
+            time.sleep(wait)
+
+    def sent(self, account, email):
+        """Record that a reserved send went out"""
+        now = datetime.now()
+        with self.lock:
+            self.reserved[account] -= 1
+            self.sends.setdefault(account, []).append(now)
+            self.write({'event': 'sent', 'account': account, 'ts': now.isoformat()})
+            if self.outstanding.pop(email, None):
+                self.write({'event': 'delivered', 'email': email})
+
+    def release(self, account):
+        """Give back a reserved send that didn't go out"""
+        with self.lock:
+            self.reserved[account] -= 1
+
+    def exhaust(self, account):
+        """The provider refused a send; stop using this account until the next invocation"""
+        with self.lock:
+            self.exhausted.add(account)
+
+    def defer(self, email, link, item=None, run_id=None, account=None):
+        """Queue an email for the next invocation, remembering which account it was assigned"""
+        event = {'event': 'deferred', 'email': email, 'link': link, 'item': item, 'run_id': run_id, 'account': account}
+        with self.lock:
+            self.outstanding[email] = event
+            self.write(event)
+
+    def drop(self, email, reason=None):
+        """Stop retrying a queued email the provider refused for good"""
+        with self.lock:
+            if self.outstanding.pop(email, None):
+                self.write({'event': 'dropped', 'email': email, 'reason': reason})
+
+    def pending(self):
+        """Emails queued by earlier invocations"""
+        with self.lock:
+            return list(self.outstanding.values())
+
+    def close(self):
+        with self.lock:
+            self.file.close()
+        print(f"Email schedule: {len(self.outstanding)} emails queued for the next invocation")
+
+class BlueprintJob:
+    def __init__(self, item, email, i, manual=False):
+        """
+        One blueprint on its way through the pipeline.
 
-    # The first 'extra_elements' chunks are size (base_size + 1).
-    # Chunks after that are size (base_size).
+        Args:
+            item (str): Journal item, the customer index or manual-<index>
+            email (str): Recipient
+            i (int): Index into the customer or manual URL lists
+            manual (bool): Whether it comes from the manual URL list
+        """
+        self.item = item
+        self.email = email
+        self.i = i
+        self.manual = manual
+        # Rendered PNG (path or bytes), then the Drive link once uploaded
+        self.image = None
+        self.link = None
+
+class MonthlyRun:
+    def __init__(self, sender, upload_engine, journal, buys_log, scheduler=None, router=None, permissions=(), cache=None, render_policy=None, email_policy=None, optimizer=None, metrics=None, force=False):
+        """
+        Renders, uploads and (optionally) emails blueprints, journaling each
+        customer's progress so an interrupted run can be resumed.
 
-    # a) Calculate total elements from 'base_size' in all preceding chunks (0-indexed)
-    preceding_chunks = chunk_index - 1
-    start_index = preceding_chunks * base_size
+        Args:
+            sender (ImageEmailSender): Renders and emails blueprints
+            upload_engine (UploadEngine): Uploads rendered blueprints
+            journal (RunJournal): Journal of this run
+            buys_log (BuysLog): Where each uploaded customer's buys are recorded
+            scheduler (EmailScheduler, optional): Paces emails; no emails are sent without one
+            router (AccountRouter, optional): Picks the account each email is sent from
+            permissions (iterable): Any of 'public', 'share' to queue for uploaded files
+            cache (RenderCache, optional): Earlier renders to reuse for identical URLs
+            render_policy (RetryPolicy, optional): Retries for rendering; uploads
+                retry inside upload_engine, reusing the rendered image
+            email_policy (RetryPolicy, optional): Retries for sending an email
+            optimizer (PngOptimizer, optional): Shrinks blueprints before they're uploaded
+            metrics (RunMetrics, optional): Where per-stage timings are recorded
+            force (bool): Re-render even URLs the cache has a render of, refreshing it
+        """
+        self.sender = sender
+        self.cache = cache
+        self.upload_engine = upload_engine
+        self.uploader = upload_engine.uploader
+        self.journal = journal
+        self.buys_log = buys_log
+        self.scheduler = scheduler
+        self.router = router
+        self.permissions = permissions
+        self.render_policy = render_policy or RetryPolicy('render')
+        self.email_policy = email_policy or RetryPolicy('email')
+        self.optimizer = optimizer
+        self.metrics = metrics or RunMetrics()
+        self.force = force
+        # The stage after which a customer is done
+        self.final_stage = 'emailed' if scheduler else 'uploaded'
+
+    def is_complete(self, item):
+        return self.journal.stage(item) == self.final_stage
+
+    def fail(self, item, email, i, reason):
+        self.sender.record_fail(email, i)
+        self.journal.record(item, email, 'failed', reason=reason)
+        self.metrics.finish(item, 'failed', email)
+
+    def run(self, manual_indices, indices, render_workers=1, upload_workers=4, email_workers=1, queue_size=8, links=None, queued=()):
+        """
+        Push the manual URL blueprints and then the customers through the
+        render -> upload -> delivery pipeline and wait for it to drain.
 
-    # b) Add the 'extra' element for all preceding chunks that were large
-    # This is the minimum of (how many chunks came before it) and (how many extra elements there are)
-    start_index += min(preceding_chunks, extra_elements)
+        Args:
+            manual_indices (list): Indices into the manual URL list
+            indices (list): Indices into the customer lists
+            render_workers (int): Blueprints rendered at once, one browser each
+            upload_workers (int): Uploads in flight at once
+            email_workers (int): Emails sent at once
+            queue_size (int): Jobs that can wait between two stages
+            links (dict, optional): Journal item -> Drive link of a blueprint already
+                in the folder, which is emailed by link without rendering it again
+            queued (iterable): Jobs from outstanding_jobs, fed straight to the
+                delivery stage alongside the renders
+        """
+        sender = self.sender
+        links = links or {}
+        stages = [Stage('render', self.render_job, render_workers, queue_size)]
+        if self.optimizer:
+            stages.append(Stage('optimize', self.optimize_job, self.optimizer.processes, queue_size))
+        stages.append(Stage('upload', self.upload_job, upload_workers, queue_size))
+        if self.scheduler:
+            stages.append(Stage('deliver', self.deliver_job, email_workers, queue_size))
+        pipeline = Pipeline(stages)
+        feeder = None
+        if queued and self.scheduler:
+            def feed_queued():
+                for job in queued:
+                    pipeline.put(job, stage='deliver')
+
+            # Its own thread, so rendering doesn't wait for the queued emails to get a place
+            feeder = threading.Thread(target=feed_queued, name='queued-emails', daemon=True)
+            feeder.start()
+        try:
+            jobs = [BlueprintJob(f"manual-{i}", sender.manual_email_list[i], i, manual=True) for i in manual_indices]
+            jobs += [BlueprintJob(str(i), sender.email_list[i], i) for i in indices]
+            for job in jobs:
+                job.link = links.get(job.item)
+                pipeline.put(job)
+        finally:
+            if feeder:
+                feeder.join()
+            pipeline.close()
+            pipeline.print_stats()
+
+    def render_job(self, job):
+        """Render stage: render the job's blueprint"""
+        sender = self.sender
+        total = len(sender.manual_url_list) if job.manual else len(sender.league_id_list)
+        print(f"{job.i + 1}/{total}")
+        if job.link is not None:
+            # Already in the folder, only the email is missing
+            return job
+        if self.journal.stage(job.item) == 'uploaded':
+            # Resumed after the upload succeeded, only the email is missing
+            job.link = self.journal.latest_record(job.item).get('link')
+            return job
+        self.journal.record(job.item, job.email, 'started')
+        try:
+            with self.metrics.timed(job.item, 'render', job.email):
+                job.image = self.render_policy.call(self.render, job.i, manual=job.manual, label=job.email)
+        except Exception as e:
+            print(f"Failed to render image {job.i + 1}/{total} for {job.email}")
+            self.fail(job.item, job.email, job.i, f"render failed: {str(e)}")
+            return None
+        if job.manual:
+            self.journal.record(job.item, job.email, 'rendered')
+        else:
+            self.journal.record(job.item, job.email, 'rendered', buys=sender.email_to_buys.get(job.email))
+        return job
 
-    # --- 4. Determine End Index (Exclusive) ---
+    def optimize_job(self, job):
+        """Optimize stage: losslessly shrink the rendered PNG, keeping the original on error"""
+        if job.link is not None:
+            return job
+        try:
+            with self.metrics.timed(job.item, 'optimize', job.email):
+                job.image = self.optimizer.optimize(job.image)
+        except Exception as e:
+            print(f"Could not optimize {job.email}.png, uploading it as rendered: {str(e)}")
+            logging.exception("Exception occurred")
+        return job
 
-    # Check if the current chunk is one of the larger chunks
-    is_large_chunk = chunk_index <= extra_elements
-    chunk_size = base_size + (1 if is_large_chunk else 0)
+    def upload_job(self, job):
+        """Upload stage: upload the rendered blueprint and do its bookkeeping"""
+        if job.link is not None:
+            return job if self.scheduler else None
+        keep_image = False
+        try:
+            print(f"Uploading {job.email}.png...")
+            with self.metrics.timed(job.item, 'upload', job.email):
+                file = self.upload_engine.upload(job.image, f"{job.email}.png", self.sender.folder_id, item=job.item)
+            if not file:
+                self.fail(job.item, job.email, job.i, "upload failed")
+                return None
+            job.link = file.get('webViewLink')
+            self.journal.record(job.item, job.email, 'uploaded', file_id=file.get('id'), link=job.link)
+            if 'public' in self.permissions:
+                self.uploader.queue_make_public(file['id'])
+            if 'share' in self.permissions:
+                self.uploader.queue_share_file(file['id'], job.email)
+            # uploader.transfer_ownership(file['id'], sender.sender_email)
+            if not job.manual:
+                self.record_buys(job.email, job.i)
+            keep_image = self.scheduler is not None
+            if not keep_image:
+                self.metrics.finish(job.item, 'ok', job.email)
+            return job if keep_image else None
+        except Exception as e:
+            print(f"\nAn upload error occurred: {str(e)}")
+            logging.exception("Exception occurred")
+            self.fail(job.item, job.email, job.i, str(e))
+            return None
+        finally:
+            if not keep_image:
+                discard_image(job.image)
 
-    end_index = start_index + chunk_size
+    def deliver_job(self, job):
+        """Delivery stage: email the blueprint, attached if it was rendered in this run"""
+        try:
+            self.deliver(job.item, job.email, job.i, image=job.image, link=job.link)
+        finally:
+            discard_image(job.image)
+
+    def render(self, i, manual=False):
+        """Render a blueprint, reusing an identical earlier render from the cache if there is one"""
+        sender = self.sender
+        if not self.cache:
+            return sender.download_image(i, manual)
+        url = sender.construct_url(i, manual)
+        with self.cache.lock_for(url):
+            cached = None if self.force else self.cache.get(url)
+            if cached:
+                image, buy_ids = cached
+                print(f"Reusing cached render of {url}")
+                if not manual:
+                    sender.store_buys(i, buy_ids)
+                return image
+            image = sender.download_image(i, manual)
+            if image:
+                buy_ids = None
+                if not manual:
+                    with sender.lock:
+                        buy_ids = sender.email_to_buys.get(sender.email_list[i])
+                self.cache.put(url, image, buy_ids)
+            return image
+
+    def record_buys(self, email, i):
+        sender = self.sender
+        user_id = sender.user_id_list[i] if len(sender.user_id_list) > 0 else None
+        with sender.lock:
+            buys = sender.email_to_buys.get(email)
+        self.buys_log.append(email, sender.league_id_list[i], user_id, buys)
+
+    def deliver(self, item, email, i, image=None, link=None):
+        """
+        Email a blueprint if the quota allows, otherwise queue its Drive link
+        for the next invocation.
+
+        Args:
+            image (str or bytes, optional): Blueprint to attach; the link is sent without one
+            link (str): Drive link of the uploaded blueprint
+        """
+        account = self.router.assign(email)
+        if account is None or not self.scheduler.reserve(account.email):
+            print(f"Daily email quota reached, queueing {censor_email(email)} for the next run")
+            if account:
+                account.deferred += 1
+            self.scheduler.defer(email, link, item, self.journal.run_id, account.email if account else None)
+            self.metrics.finish(item, 'deferred', email)
+            return
+        try:
+            with self.metrics.timed(item, 'email', email):
+                if image is not None:
+                    self.email_policy.call(self.sender.send_image_directly, email, image, f"{email}.png", account=account, label=censor_email(email))
+                    print(f"Successfully sent image to {censor_email(email)} from {account.email}\n")
+                else:
+                    self.email_policy.call(self.sender.send_email_link, email, link, account=account, label=censor_email(email))
+                    print(f"Successfully sent link to {censor_email(email)} from {account.email}\n")
+            self.scheduler.sent(account.email, email)
+            account.sent += 1
+            self.journal.record(item, email, 'emailed', account=account.email, link=link)
+            self.metrics.finish(item, 'ok', email)
+        except smtplib.SMTPDataError as e:
+            print(f"\nAn email error occurred: {str(e)}")
+            logging.exception("SMTPDataError occurred")
+            self.scheduler.release(account.email)
+            if is_quota_error(e):
+                # The provider's own sending limit; stop using this account and queue the email
+                self.scheduler.exhaust(account.email)
+                account.deferred += 1
+                self.scheduler.defer(email, link, item, self.journal.run_id, account.email)
+                self.metrics.finish(item, 'deferred', email)
+            else:
+                # This message was refused, e.g. for its content; the account is fine
+                self.give_up(item, email, i, account, e)
+        except Exception as e:
+            print(f"\nAn email error occurred: {str(e)}")
+            logging.exception("Exception occurred")
+            self.scheduler.release(account.email)
+            self.give_up(item, email, i, account, e)
 
-    return (start_index, end_index)
+    def give_up(self, item, email, i, account, error):
+        """Record a failed email, and unqueue it if sending it again can't succeed"""
+        account.failed += 1
+        if not is_transient(error):
+            self.scheduler.drop(email, str(error))
+        self.fail(item, email, i, f"email error: {str(error)}")
+
+    def outstanding_jobs(self):
+        """
+        Delivery jobs for the emails earlier invocations couldn't fit in their
+        quota, each pinned to the account it was assigned.
+
+        Returns:
+            list: BlueprintJobs with their Drive link set, for run()'s queued
+        """
+        jobs = []
+        for entry in self.scheduler.pending():
+            self.router.pin(entry['email'], entry.get('account'))
+            item = entry['item'] if entry.get('run_id') == self.journal.run_id else f"queued-{entry['email']}"
+            job = BlueprintJob(item, entry['email'], None)
+            job.link = entry['link']
+            jobs.append(job)
+        return jobs
 
 def main():
     parser = argparse.ArgumentParser()
     parser.add_argument('-s', '--send_email', type=int, default=0, help="Whether or not to send emails (0 or 1)")
-    parser.add_argument('-si', '--start_index', type=int, default=0, help="Start index for processing images")
     parser.add_argument('-ci', '--chunk_index', type=int, default=1, help="Chunk index (1-based)")
     parser.add_argument('-nc', '--number_of_chunks', type=int, default=1, help="Number of chunks")
+    parser.add_argument('-sp', '--shard_plan', default=None, help="Shard plan from shard_planner.py to take the chunk's customers from")
+    parser.add_argument('-mr', '--max_renders_per_driver', type=int, default=50, help="Restart each browser after this many renders (0 = never)")
+    parser.add_argument('-w', '--workers', type=int, default=1, help="Number of customers to process concurrently, each with its own browser")
+    parser.add_argument('-uw', '--upload_workers', type=int, default=4, help="Number of concurrent Drive uploads")
+    parser.add_argument('-mp', '--make_public', type=int, default=0, help="Whether to make each uploaded blueprint public (0 or 1)")
+    parser.add_argument('-sh', '--share', type=int, default=0, help="Whether to share each uploaded blueprint with its customer (0 or 1)")
+    parser.add_argument('-u', '--upsert', type=int, default=1, help="Whether to update an existing <email>.png in place instead of uploading a duplicate (0 or 1)")
+    parser.add_argument('-f', '--force', action='store_true', help="Re-render blueprints that are already in the Drive folder or the render cache")
+    parser.add_argument('-c', '--capture', choices=['download', 'memory'], default='download', help="Save blueprints through Chrome's downloads or read them from the page in memory")
+    parser.add_argument('-ss', '--smtp_sessions', type=int, default=2, help="Number of SMTP sessions to keep open and send on in parallel")
+    parser.add_argument('-dq', '--daily_quota', type=int, default=500, help="Most emails to send in any 24 hours; the rest are queued for the next run")
+    parser.add_argument('-pm', '--per_minute', type=int, default=20, help="Most emails to send in any minute (0 = no limit)")
+    parser.add_argument('-rc', '--render_cache', type=int, default=1, help="Whether to reuse earlier renders of identical URLs (0 or 1)")
+    parser.add_argument('-dv', '--data_version', default=None, help="Data stamp for the render cache, defaults to a hash of the app source (and --dist build); set it when rendering from a deployment that doesn't match this checkout")
+    parser.add_argument('-rct', '--render_cache_ttl', type=float, default=24, help="Hours a cached render stays valid (0 = forever)")
+    parser.add_argument('-sl', '--sleeper_proxy', choices=['off', 'live', 'record', 'replay'], default='off', help="Route the app's Sleeper API calls through a local caching proxy; record/replay save and serve fixtures")
+    parser.add_argument('-slt', '--sleeper_proxy_ttl', type=float, default=3600, help="Seconds the Sleeper proxy caches a response")
+    parser.add_argument('-slf', '--sleeper_fixtures', default='sleeper_fixtures', help="Directory of Sleeper proxy fixtures")
+    parser.add_argument('-bu', '--base_url', default=DEFAULT_BASE_URL, help="URL the app is served from")
+    parser.add_argument('-d', '--dist', default=None, help="Serve this built app directory locally and render from it instead of --base_url")
+    parser.add_argument('-rm', '--render_mode', choices=['reload', 'spa'], default='reload', help="'spa' loads the app once per browser and navigates between blueprints by hash route")
+    parser.add_argument('-ra', '--render_attempts', type=int, default=3, help="Times to try rendering a blueprint; permanent failures such as a missing league aren't retried")
+    parser.add_argument('-ua', '--upload_attempts', type=int, default=3, help="Times to try each upload, reusing the rendered image")
+    parser.add_argument('-ea', '--email_attempts', type=int, default=3, help="Times to try sending each email")
+    parser.add_argument('-ew', '--email_workers', type=int, default=2, help="Number of emails to send concurrently")
+    parser.add_argument('-qs', '--queue_size', type=int, default=8, help="Blueprints that can wait between two pipeline stages before the earlier stage pauses")
+    parser.add_argument('-op', '--optimize_png', type=int, default=0, help="Losslessly recompress blueprints before uploading/emailing them (0 or 1)")
+    parser.add_argument('-ow', '--optimize_workers', type=int, default=None, help="Processes optimizing PNGs (default: one per CPU)")
+    parser.add_argument('-oq', '--quantize_colors', type=int, default=0, help="Also try reducing blueprints to a palette of this many colors when it's smaller (lossy, needs Pillow)")
+    parser.add_argument('-pf', '--preflight', choices=['off', 'flag', 'remove'], default='remove', help="Check every customer's league and team/user ID against Sleeper before rendering, and flag or remove (fail without rendering) bad rows")
+    parser.add_argument('-rb', '--render_backend', choices=['selenium', 'cdp'], default='selenium', help="'cdp' renders in tabs of one Chrome driven over the DevTools protocol, without chromedriver (needs websockets; always captures in memory)")
+    parser.add_argument('-cb', '--chrome_binary', default='google-chrome', help="Chrome executable for the cdp render backend")
+    parser.add_argument('-rr', '--run_report', default='run_report.json', help="Where to write the run's per-stage timing report")
+    parser.add_argument('-r', '--resume', default=None, help="Run ID whose journal to continue, redoing only incomplete or failed customers")
     
     args = parser.parse_args()
     if int(args.send_email) != 1 and int(args.send_email) != 0:
@@ -363,70 +1076,137 @@ def main():
         return
     send_email = bool(int(args.send_email))
     print(f"Sending emails: {send_email}")
-    sender = ImageEmailSender(send_email)
-
+    workers = int(args.workers)
+    if workers < 1:
+        print("--workers must be at least 1")
+        return
     chunk_index = int(args.chunk_index)
     number_of_chunks = int(args.number_of_chunks)
     if chunk_index < 1 or chunk_index > number_of_chunks:
         print("--chunk_index must be between 1 and --number_of_chunks")
         return
 
-    (start_idx, end_idx) = (0, 0)
-    if sender.league_id_list != None and sender.league_id_list != []:
-        (start_idx, end_idx) = get_chunk_indices(sender.league_id_list, chunk_index, number_of_chunks)
-
-    # start_idx = int(args.start_index)
-
-    # Path to your service account credentials JSON file
-    credentials_path = 'service-account-credentials.json'
-
-    # Initialize uploader
-    uploader = GoogleDriveUploader(credentials_path)
+    dist_server = None
+    sleeper_proxy = None
+    renderer = None
+    scheduler = None
+    router = None
+    optimizer = None
+    base_url = args.base_url
+    try:
+        if args.dist:
+            dist_server = DistServer(args.dist).start()
+            base_url = dist_server.url
+        if args.sleeper_proxy != 'off':
+            sleeper_proxy = SleeperProxy(args.sleeper_proxy, ttl=float(args.sleeper_proxy_ttl), fixtures_dir=args.sleeper_fixtures).start()
+        if args.render_backend == 'cdp':
+            renderer = CdpRenderer(
+                args.chrome_binary,
+                tabs=workers,
+                max_renders_per_tab=int(args.max_renders_per_driver),
+                scripts=[sleeper_proxy.rewrite_script()] if sleeper_proxy else [],
+                chrome_args=SLEEPER_PROXY_CHROME_ARGS if sleeper_proxy else []
+            ).start()
+        metrics = RunMetrics()
+        sender = ImageEmailSender(send_email, max_renders_per_driver=int(args.max_renders_per_driver), workers=workers, capture=args.capture, smtp_sessions=int(args.smtp_sessions), sleeper_proxy=sleeper_proxy, base_url=base_url, render_mode=args.render_mode, renderer=renderer, metrics=metrics)
+
+        chunk_indices = []
+        if sender.league_id_list != None and sender.league_id_list != []:
+            if args.shard_plan:
+                chunk_indices = load_shard(args.shard_plan, chunk_index, number_of_chunks, len(sender.league_id_list))
+            else:
+                (start_idx, end_idx) = get_chunk_indices(len(sender.league_id_list), chunk_index, number_of_chunks)
+                chunk_indices = range(start_idx, end_idx)
+
+        journal = RunJournal(args.resume)
+        print(f"Run ID: {journal.run_id} (journal: {journal.path})")
+
+        # Path to your service account credentials JSON file
+        credentials_path = 'service-account-credentials.json'
+
+        # Initialize uploader
+        permission_policy = RetryPolicy('permissions', base_delay=2)
+        uploader = GoogleDriveUploader(credentials_path, permission_policy=permission_policy)
+        permissions = []
+        if int(args.make_public) == 1:
+            permissions.append('public')
+        if int(args.share) == 1:
+            permissions.append('share')
+        upsert = int(args.upsert) == 1
+        render_policy = RetryPolicy('render', int(args.render_attempts), base_delay=5)
+        upload_policy = RetryPolicy('upload', int(args.upload_attempts), base_delay=2)
+        email_policy = RetryPolicy('email', int(args.email_attempts), base_delay=5)
+        upload_engine = UploadEngine(uploader, upsert=upsert, policy=upload_policy, metrics=metrics)
+        buys_log = BuysLog(os.path.join(os.path.dirname(journal.path), f"{journal.run_id}-buys.jsonl"))
+        if send_email:
+            scheduler = EmailScheduler(daily_quota=int(args.daily_quota), per_minute=int(args.per_minute))
+            for account in sender.accounts:
+                if account.daily_quota is not None:
+                    scheduler.set_quota(account.email, account.daily_quota)
+            router = AccountRouter(sender.accounts, scheduler)
+            print(f"Sending from {len(sender.accounts)} account(s)")
+        cache = None
+        if int(args.render_cache) == 1:
+            data_version = args.data_version or default_data_version(args.dist)
+            print(f"Render cache data version: {data_version}")
+            cache = RenderCache(data_version=data_version, max_age_hours=float(args.render_cache_ttl))
+        if int(args.optimize_png) == 1:
+            optimizer = PngOptimizer(args.optimize_workers, quantize_colors=int(args.quantize_colors))
+        run = MonthlyRun(sender, upload_engine, journal, buys_log, scheduler=scheduler, router=router, permissions=permissions, cache=cache, render_policy=render_policy, email_policy=email_policy, optimizer=optimizer, metrics=metrics, force=args.force)
+    except BaseException:
+        # The run's own cleanup below hasn't been set up yet; stop the services started so far
+        if optimizer:
+            optimizer.close()
+        if renderer:
+            renderer.close()
+        if sleeper_proxy:
+            sleeper_proxy.stop()
+        if dist_server:
+            dist_server.stop()
+        raise
 
     try:
         # Authenticate
         uploader.authenticate()
         print(f"Folder link: https://drive.google.com/drive/folders/{sender.folder_id}")
+        if not args.force or upsert:
+            uploader.build_folder_index(sender.folder_id)
+        # Blueprints already in the folder are skipped when no emails are sent.
+        # When they are, the ones no journal shows as emailed are sent by link.
+        queued_jobs = run.outstanding_jobs() if scheduler else []
+        if queued_jobs:
+            print(f"Delivering {len(queued_jobs)} emails queued by earlier runs alongside this one")
+        queued = {job.email for job in queued_jobs}
+        emailed = emailed_files(os.path.dirname(journal.path)) if scheduler else set()
+        links = {}
+
+        def already_uploaded(item, email):
+            """Whether to skip an item because its blueprint is already in the folder"""
+            if args.force or run.journal.stage(item) == 'uploaded':
+                return False
+            file_id = uploader.indexed_file_id(sender.folder_id, f"{email}.png")
+            if file_id is None:
+                return False
+            if scheduler and (email, file_id) not in emailed:
+                links[item] = f"https://drive.google.com/file/d/{file_id}/view"
+            return True
 
         print(f"Running manual URL list ({len(sender.manual_url_list)})...")
+        manual_indices = []
         for i in range(len(sender.manual_url_list)):
             if sender.manual_url_list[i] == '' or sender.manual_url_list[i] == None:
                 continue
-            print(f"{i + 1}/{len(sender.manual_url_list)}")
-            for attempt in range(3): # This loop provides two retries
-                try:
-                    downloaded_file_path = sender.download_image(i, manual=True)
-                    if not downloaded_file_path:
-                        print(f"Failed to download image {i + 1}/{len(sender.manual_url_list)} for {sender.manual_email_list[i]}")
-                        continue
-
-                    time.sleep(0.1)
-                    print(f"Uploading {downloaded_file_path}...")
-                    file = uploader.upload_image(downloaded_file_path, f"{sender.manual_email_list[i]}.png", sender.folder_id)
-                    # if file:
-                    #     uploader.make_public(file['id'])
-                        # uploader.transfer_ownership(file['id'], sender.sender_email)
-                    os.remove(downloaded_file_path)
-                    break # Exit the retry loop on success
-
-                except smtplib.SMTPDataError as e:
-                    print(f"\nAn email error occurred: {str(e)}")
-                    logging.exception("SMTPDataError occurred")
-                    sender.fails.append(sender.email_list[i])
-                    sender.fail_indices.append(i)
-                    print("exiting early due to email error")
-                    break
-                except Exception as e:
-                    print(f"\nAn upload/email error occurred: {str(e)}")
-                    logging.exception("Exception occurred")
-                    if attempt == 2: # Check if this is the final attempt
-                        sender.fails.append(sender.manual_email_list[i])
-                        sender.fail_indices.append(i)
-        
+            if run.is_complete(f"manual-{i}") or sender.manual_email_list[i] in queued:
+                continue
+            if already_uploaded(f"manual-{i}", sender.manual_email_list[i]) and f"manual-{i}" not in links:
+                print(f"Skipping manual {i + 1}/{len(sender.manual_url_list)}: Already uploaded")
+                continue
+            manual_indices.append(i)
 
         print(f"Allow list length: {len(sender.allow_list)}")
         # print("No folder run, emailing directly")
-        for i in range(start_idx, end_idx):
+        indices = []
+        for i in chunk_indices:
             if sender.league_id_list[i] == '' or sender.league_id_list[i] == None:
                 continue
             has_invalid_team_id = i >= len(sender.team_id_list) or sender.team_id_list[i] == '' or sender.team_id_list[i] == None
@@ -436,55 +1216,52 @@ def main():
                 continue
             if sender.email_list[i] in sender.skip_list:
                 continue
+            if run.is_complete(str(i)):
+                print(f"Skipping {i + 1}/{len(sender.league_id_list)}: Completed earlier in run {journal.run_id}")
+                continue
+            if sender.email_list[i] in queued:
+                print(f"Skipping {i + 1}/{len(sender.league_id_list)}: Email already queued for delivery")
+                continue
+            if already_uploaded(str(i), sender.email_list[i]) and str(i) not in links:
+                print(f"Skipping {i + 1}/{len(sender.league_id_list)}: Already uploaded")
+                continue
 
             if len(sender.allow_list) > 0 and not sender.email_list[i] in sender.allow_list:
                 print(f"Skipping {i + 1}/{len(sender.league_id_list)}: Not in allow list")
                 continue
-            print(f"{i + 1}/{len(sender.league_id_list)}")
-
-            for attempt in range(3): # This loop provides two retries
-                try:
-                    downloaded_file_path = sender.download_image(i)
-                    if not downloaded_file_path:
-                        print(f"Failed to download image {i + 1}/{len(sender.league_id_list)} for {sender.email_list[i]}")
-                        if attempt == 1:
-                            sender.fails.append(sender.email_list[i])
-                            sender.fail_indices.append(i)
-                            print(f"failed indices: {sender.fail_indices}")
-                        continue
-
-                    time.sleep(0.1)
-                    print(f"Uploading {downloaded_file_path}...")
-                    file = uploader.upload_image(downloaded_file_path, f"{sender.email_list[i]}.png", sender.folder_id)
-                    # if file:
-                    #     uploader.make_public(file['id'])
-                        # uploader.transfer_ownership(file['id'], sender.sender_email)
-                    # sender.send_image_directly(sender.email_list[i], downloaded_file_path)
-                    # print(f"Successfully sent image to {censor_email(sender.email_list[i])}\n")
-                    
-                    with open("email_to_buys.json", "w") as json_file:
-                        json.dump(sender.email_to_buys, json_file, indent=4)
-                    with open("league_id_to_buys.json", "w") as json_file:
-                        json.dump(sender.league_id_to_buys, json_file, indent=4)
-                    with open("user_id_to_buys.json", "w") as json_file:
-                        json.dump(sender.user_id_to_buys, json_file, indent=4)
-                    os.remove(downloaded_file_path)
-                    break # Exit the retry loop on success
-
-                except smtplib.SMTPDataError as e:
-                    print(f"\nAn email error occurred: {str(e)}")
-                    logging.exception("SMTPDataError occurred")
-                    sender.fails.append(sender.email_list[i])
-                    sender.fail_indices.append(i)
-                    print("exiting early due to email error")
-                    break
-                except Exception as e:
-                    print(f"\nAn upload/email error occurred: {str(e)}")
-                    logging.exception("Exception occurred")
-                    if attempt == 2: # Check if this is the final attempt
-                        sender.fails.append(sender.email_list[i])
-                        sender.fail_indices.append(i)
-        
+            indices.append(i)
+        if args.preflight != 'off':
+            preflight = Preflight(
+                mode=args.sleeper_proxy if args.sleeper_proxy in ('record', 'replay') else 'live',
+                fixtures_dir=args.sleeper_fixtures
+            )
+            rows = []
+            for i in indices:
+                if str(i) in links:
+                    continue
+                # The team ID list can be shorter than the league list; rows without a team ID go by user ID
+                if i < len(sender.team_id_list) and sender.team_id_list[i] not in ('', None):
+                    rows.append((i, sender.league_id_list[i], sender.team_id_list[i], None))
+                else:
+                    rows.append((i, sender.league_id_list[i], None, sender.user_id_list[i] if i < len(sender.user_id_list) else None))
+            bad = preflight.check(rows)
+            preflight.print_stats()
+            for i, reason in sorted(bad.items()):
+                print(f"Preflight: {i + 1}/{len(sender.league_id_list)} ({censor_email(sender.email_list[i])}): {reason}")
+                if args.preflight == 'remove':
+                    run.fail(str(i), sender.email_list[i], i, f"preflight: {reason}")
+            if args.preflight == 'remove':
+                indices = [i for i in indices if i not in bad]
+            print(f"Preflight: {len(bad)} bad rows {'removed' if args.preflight == 'remove' else 'flagged'}")
+        if links:
+            print(f"{len(links)} blueprints are already in the folder but were never emailed, sending their links")
+        if args.resume:
+            print(f"Resuming run {journal.run_id}: {len(indices)} customers left")
+        run.run(manual_indices, indices, render_workers=workers, upload_workers=int(args.upload_workers),
+                email_workers=int(args.email_workers), queue_size=int(args.queue_size), links=links, queued=queued_jobs)
+        if permissions:
+            with metrics.timed(None, 'permissions'):
+                uploader.flush_permissions()
 
         print("\nDone!")
         print(f"Folder link: https://drive.google.com/drive/folders/{sender.folder_id}")
@@ -498,10 +1275,36 @@ def main():
         print("3. Enabled the Google Drive API in your project")
         print("4. Placed your images in the 'images' folder")
     finally:
+        sender.driver_pool.close()
+        if renderer:
+            renderer.close()
+        if router:
+            router.close()
+            router.print_stats()
+        if scheduler:
+            scheduler.close()
+        policies = (render_policy, upload_policy, email_policy, permission_policy)
+        for policy in policies:
+            policy.print_stats()
+        metrics.write_report(args.run_report, run_id=journal.run_id, policies=policies)
+        if cache:
+            cache.print_stats()
+        if optimizer:
+            optimizer.close()
+            optimizer.print_stats()
+        if sleeper_proxy:
+            sleeper_proxy.print_stats()
+            sleeper_proxy.stop()
+        if dist_server:
+            dist_server.stop()
+        journal.close()
+        buys_log.compact()
+        buys_log.close()
         if len(sender.fails) > 0:
             print("\nFailed to download the following images:")
             for fail in sender.fails:
                 print(fail)
+        print(f"\nTo retry incomplete customers: --resume {journal.run_id}")
 
 if __name__ == "__main__":
     main()
@@ -0,0 +1,28 @@
+# Scripts the render backends run in the blueprint pages.
+
+# Intercepts the export button's data URL download so the PNG can be read
+# straight out of the page instead of going through Chrome's download manager.
+CAPTURE_SCRIPT = """
+window.__blueprintCapture = null;
+if (!window.__blueprintCaptureInstalled) {
+    window.__blueprintCaptureInstalled = true;
+    const click = HTMLAnchorElement.prototype.click;
+    HTMLAnchorElement.prototype.click = function () {
+        if (this.download && this.href.startsWith('data:image/png')) {
+            window.__blueprintCapture = this.href;
+            return;
+        }
+        return click.call(this);
+    };
+}
+"""
+
+# Readiness contract with the weekly/infinite pages: returns the buy IDs once
+# the blueprint, its fonts and its images have finished rendering, else null.
+READY_SCRIPT = """
+const signal = document.getElementById('blueprint-ready');
+if (!signal || signal.dataset.ready !== 'true') return null;
+if (document.fonts.status !== 'loaded') return null;
+if (!Array.from(document.images).every(img => img.complete)) return null;
+return {buyIds: signal.dataset.buyIds};
+"""
@@ -0,0 +1,115 @@
+import logging
+import queue
+import threading
+import time
+
+# Tells a stage worker there is no more work
+STOP = object()
+
+class Stage:
+    def __init__(self, name, fn, workers=1, queue_size=0):
+        """
+        One step of a Pipeline: a bounded queue drained by its own workers.
+
+        Args:
+            name (str): Name for stats
+            fn (callable): Takes a job and returns the job for the next stage,
+                or None if it stops here
+            workers (int): Jobs this stage works on at once
+            queue_size (int): Jobs that can wait for this stage before whoever
+                feeds it blocks (0 = unbounded)
+        """
+        self.name = name
+        self.fn = fn
+        self.workers = max(1, workers)
+        self.queue = queue.Queue(maxsize=queue_size)
+        self.next = None
+        self.threads = []
+        self.lock = threading.Lock()
+        self.processed = 0
+        self.busy = 0.0
+        # Time workers spent waiting for room in the next stage's queue
+        self.blocked = 0.0
+        self.max_depth = 0
+
+    def start(self):
+        for n in range(self.workers):
+            thread = threading.Thread(target=self.work, name=f"{self.name}-{n + 1}", daemon=True)
+            thread.start()
+            self.threads.append(thread)
+
+    def put(self, job):
+        """Queue a job, blocking while the queue is full"""
+        self.queue.put(job)
+        with self.lock:
+            self.max_depth = max(self.max_depth, self.queue.qsize())
+
+    def work(self):
+        while True:
+            job = self.queue.get()
+            if job is STOP:
+                return
+            start = time.monotonic()
+            try:
+                result = self.fn(job)
+            except Exception:
+                logging.exception(f"Unhandled error in {self.name} stage")
+                result = None
+            finished = time.monotonic()
+            if result is not None and self.next:
+                self.next.put(result)
+            with self.lock:
+                self.processed += 1
+                self.busy += finished - start
+                self.blocked += time.monotonic() - finished
+
+    def close(self):
+        """Wait for every queued job to be worked on, then stop the workers"""
+        for _ in self.threads:
+            self.queue.put(STOP)
+        for thread in self.threads:
+            thread.join()
+
+class Pipeline:
+    def __init__(self, stages):
+        """
+        Chain stages so each one's output feeds the next. Every stage works
+        concurrently with the others, and a full queue makes the stage
+        before it wait, so a slow stage holds back the ones feeding it
+        instead of letting work pile up in memory.
+
+        Args:
+            stages (list): Stages in the order jobs pass through them
+        """
+        self.stages = stages
+        for stage, next_stage in zip(stages, stages[1:]):
+            stage.next = next_stage
+        self.started = time.monotonic()
+        for stage in stages:
+            stage.start()
+
+    def put(self, job, stage=None):
+        """
+        Feed a job to the first stage, blocking while it is backed up.
+
+        Args:
+            stage (str, optional): Name of a later stage to feed instead, for
+                jobs whose earlier steps are already done
+        """
+        if stage is None:
+            self.stages[0].put(job)
+        else:
+            next(s for s in self.stages if s.name == stage).put(job)
+
+    def close(self):
+        """Drain every stage in order and stop their workers"""
+        for stage in self.stages:
+            stage.close()
+
+    def print_stats(self):
+        elapsed = time.monotonic() - self.started
+        print(f"Pipeline finished in {elapsed:.0f}s")
+        for stage in self.stages:
+            utilization = 100 * stage.busy / (stage.workers * elapsed) if elapsed else 0
+            print(f"  {stage.name}: {stage.processed} jobs, {stage.workers} workers, {utilization:.0f}% busy, "
+                  f"{stage.blocked:.0f}s blocked on the next stage, peak queue {stage.max_depth}")
@@ -0,0 +1,150 @@
+import io
+import multiprocessing
+import os
+import struct
+import threading
+import zlib
+from concurrent.futures import ProcessPoolExecutor
+
+try:
+    from PIL import Image
+except ImportError:
+    Image = None
+
+PNG_SIGNATURE = b'\x89PNG\r\n\x1a\n'
+
+# Metadata the browser may write that nothing downstream reads
+DROPPED_CHUNKS = {b'tEXt', b'iTXt', b'zTXt', b'tIME'}
+
+def read_chunks(data):
+    """
+    Returns:
+        list: (type, body) for every chunk of a PNG
+    """
+    if not data.startswith(PNG_SIGNATURE):
+        raise ValueError("Not a PNG")
+    chunks = []
+    offset = len(PNG_SIGNATURE)
+    while offset < len(data):
+        length, chunk_type = struct.unpack('>I4s', data[offset:offset + 8])
+        chunks.append((chunk_type, data[offset + 8:offset + 8 + length]))
+        offset += 12 + length
+        if chunk_type == b'IEND':
+            break
+    return chunks
+
+def write_chunk(out, chunk_type, body):
+    out.write(struct.pack('>I', len(body)))
+    out.write(chunk_type)
+    out.write(body)
+    out.write(struct.pack('>I', zlib.crc32(chunk_type + body) & 0xffffffff))
+
+def recompress(data):
+    """
+    Losslessly shrink a PNG by re-deflating its image data at the highest
+    compression level, merging its IDAT chunks and dropping text metadata.
+    The pixels, filters and color chunks are left exactly as they were.
+    """
+    chunks = read_chunks(data)
+    raw = zlib.decompress(b''.join(body for chunk_type, body in chunks if chunk_type == b'IDAT'))
+    compressor = zlib.compressobj(9, zlib.DEFLATED, 15, 9)
+    idat = compressor.compress(raw) + compressor.flush()
+
+    out = io.BytesIO()
+    out.write(PNG_SIGNATURE)
+    wrote_idat = False
+    for chunk_type, body in chunks:
+        if chunk_type in DROPPED_CHUNKS:
+            continue
+        if chunk_type == b'IDAT':
+            if not wrote_idat:
+                write_chunk(out, b'IDAT', idat)
+                wrote_idat = True
+            continue
+        write_chunk(out, chunk_type, body)
+    return out.getvalue()
+
+def quantize(data, colors):
+    """Reduce a PNG to a palette of at most `colors` colors. Lossy; needs Pillow."""
+    with Image.open(io.BytesIO(data)) as image:
+        paletted = image.convert('RGBA').quantize(colors, method=Image.Quantize.FASTOCTREE)
+    out = io.BytesIO()
+    paletted.save(out, format='PNG', optimize=True)
+    return out.getvalue()
+
+def optimize_png(data, quantize_colors=0):
+    """
+    Returns:
+        bytes: The smallest of the original PNG and its optimized versions
+    """
+    best = data
+    candidates = [recompress(data)]
+    if quantize_colors:
+        candidates.append(recompress(quantize(data, quantize_colors)))
+    for candidate in candidates:
+        if len(candidate) < len(best):
+            best = candidate
+    return best
+
+def optimize_image(image, quantize_colors=0):
+    """
+    Optimize a PNG given as bytes or as a path; a file is rewritten in place.
+
+    Returns:
+        tuple: (optimized image in the same form, bytes before, bytes after)
+    """
+    if isinstance(image, bytes):
+        optimized = optimize_png(image, quantize_colors)
+        return optimized, len(image), len(optimized)
+    with open(image, 'rb') as file:
+        data = file.read()
+    optimized = optimize_png(data, quantize_colors)
+    if len(optimized) < len(data):
+        tmp_path = f"{image}.tmp"
+        with open(tmp_path, 'wb') as file:
+            file.write(optimized)
+        os.replace(tmp_path, image)
+    return image, len(data), len(optimized)
+
+class PngOptimizer:
+    def __init__(self, processes=None, quantize_colors=0):
+        """
+        Optimize rendered blueprints on a pool of processes, so compression
+        doesn't hold up the threads rendering and uploading.
+
+        Args:
+            processes (int, optional): Worker processes, defaults to one per CPU
+            quantize_colors (int): Also try a palette of this many colors (lossy,
+                needs Pillow); 0 keeps the optimization lossless
+        """
+        if quantize_colors and Image is None:
+            raise ImportError("Palette quantization needs Pillow: pip install pillow")
+        self.quantize_colors = quantize_colors
+        self.processes = processes or os.cpu_count() or 1
+        # Spawned, not forked: forking now would copy the locks other threads hold
+        self.executor = ProcessPoolExecutor(max_workers=self.processes, mp_context=multiprocessing.get_context('spawn'))
+        self.lock = threading.Lock()
+        self.optimized = 0
+        self.bytes_before = 0
+        self.bytes_after = 0
+
+    def optimize(self, image):
+        """
+        Returns:
+            str or bytes: The optimized image, in the same form it was given
+        """
+        optimized, before, after = self.executor.submit(optimize_image, image, self.quantize_colors).result()
+        with self.lock:
+            self.optimized += 1
+            self.bytes_before += before
+            self.bytes_after += after
+        return optimized
+
+    def print_stats(self):
+        saved = self.bytes_before - self.bytes_after
+        percent = 100 * saved / self.bytes_before if self.bytes_before else 0
+        print(f"PNG optimizer: {self.optimized} images, {self.bytes_before / 1e6:.1f} MB -> "
+              f"{self.bytes_after / 1e6:.1f} MB ({saved / 1e6:.1f} MB, {percent:.0f}% saved)")
+
+    def close(self):
+        self.executor.shutdown(wait=True)
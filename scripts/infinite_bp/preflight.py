@@ -0,0 +1,141 @@
+import json
+import os
+import time
+import urllib.request
+from concurrent.futures import ThreadPoolExecutor
+
+from sleeper_proxy import SLEEPER_API, read_fixture, write_fixture
+
+class Preflight:
+    def __init__(self, workers=16, cache_path='preflight_cache.json', max_age_hours=24, mode='live', fixtures_dir='sleeper_fixtures'):
+        """
+        Check every customer's league and team/user ID against Sleeper before
+        any browser is launched, so bad rows don't burn a render timeout each.
+
+        Args:
+            workers (int): Leagues fetched at once
+            cache_path (str): Where league lookups are cached between runs
+            max_age_hours (float): How long a cached league lookup stays valid
+            mode (str): 'live' asks Sleeper, 'record' also saves fixtures,
+                'replay' answers only from fixtures (same format as SleeperProxy's)
+            fixtures_dir (str): Where fixtures are saved and replayed from
+        """
+        self.workers = workers
+        self.cache_path = cache_path
+        self.max_age = max_age_hours * 3600
+        self.mode = mode
+        self.fixtures_dir = fixtures_dir
+        if mode == 'record':
+            os.makedirs(fixtures_dir, exist_ok=True)
+        self.cache = {}
+        if os.path.exists(cache_path):
+            with open(cache_path, 'r') as file:
+                self.cache = json.load(file)
+        self.fetched = 0
+        self.unreachable = 0
+
+    def get_json(self, path):
+        if self.mode == 'replay':
+            response = read_fixture(self.fixtures_dir, path)
+            if response is None:
+                raise LookupError(f"No fixture for {path}")
+        else:
+            request = urllib.request.Request(SLEEPER_API + path, headers={'User-Agent': 'dynasty-ff-sender'})
+            with urllib.request.urlopen(request, timeout=30) as upstream:
+                response = (upstream.status, upstream.headers.get('Content-Type', 'application/json'), upstream.read())
+            if self.mode == 'record':
+                write_fixture(self.fixtures_dir, path, response)
+        status, _, body = response
+        if status != 200:
+            raise Exception(f"Sleeper returned {status} for {path}")
+        return json.loads(body or b'null')
+
+    def load_league(self, league_id):
+        """
+        Returns:
+            dict: Whether the league exists, how many teams the app can pick
+                from by teamId, and which users own or co-own a roster
+        """
+        if self.get_json(f"/v1/league/{league_id}") is None:
+            return {'exists': False, 'checked': time.time()}
+        rosters = self.get_json(f"/v1/league/{league_id}/rosters") or []
+        users = self.get_json(f"/v1/league/{league_id}/users") or []
+        owner_ids = {roster.get('owner_id') for roster in rosters}
+        members = set(owner_ids)
+        for roster in rosters:
+            members.update(roster.get('co_owners') or [])
+        return {
+            'exists': True,
+            # The app only lists users who own a roster, and teamId indexes that list
+            'teams': len([user for user in users if user.get('user_id') in owner_ids]),
+            'members': sorted(member for member in members if member),
+            'checked': time.time(),
+        }
+
+    def fetch_league(self, league_id):
+        try:
+            return league_id, self.load_league(league_id)
+        except Exception as e:
+            print(f"Preflight could not check league {league_id}: {str(e)}")
+            return league_id, None
+
+    def check(self, rows):
+        """
+        Args:
+            rows (list): (index, league ID, team ID or None, user ID or None)
+
+        Returns:
+            dict: Index -> reason for every row that can't render. Rows whose
+                league couldn't be looked up are assumed fine.
+        """
+        now = time.time()
+        stale = sorted({
+            str(league_id) for _, league_id, _, _ in rows
+            if str(league_id).isdigit()
+            and now - self.cache.get(str(league_id), {}).get('checked', 0) > self.max_age
+        })
+        if stale:
+            print(f"Preflight: checking {len(stale)} leagues ({len(self.cache)} cached)...")
+            with ThreadPoolExecutor(max_workers=self.workers) as executor:
+                for league_id, league in executor.map(self.fetch_league, stale):
+                    if league is None:
+                        self.unreachable += 1
+                        continue
+                    self.fetched += 1
+                    self.cache[league_id] = league
+            self.save()
+
+        bad = {}
+        for i, league_id, team_id, user_id in rows:
+            reason = self.validate(str(league_id), team_id, user_id)
+            if reason:
+                bad[i] = reason
+        return bad
+
+    def validate(self, league_id, team_id, user_id):
+        """
+        Returns:
+            str: Why the row can't render, or None if it looks fine
+        """
+        if not league_id.isdigit():
+            return f"invalid league ID '{league_id}'"
+        league = self.cache.get(league_id)
+        if league is None:
+            return None
+        if not league['exists']:
+            return f"league {league_id} not found"
+        if team_id is not None:
+            if not str(team_id).isdigit() or int(team_id) >= league['teams']:
+                return f"team {team_id} out of range, league {league_id} has {league['teams']} teams"
+        elif user_id not in league['members']:
+            return f"user {user_id} has no roster in league {league_id}"
+        return None
+
+    def save(self):
+        tmp_path = f"{self.cache_path}.tmp"
+        with open(tmp_path, 'w') as file:
+            json.dump(self.cache, file)
+        os.replace(tmp_path, self.cache_path)
+
+    def print_stats(self):
+        print(f"Preflight: fetched {self.fetched} leagues, {self.unreachable} unreachable")
@@ -0,0 +1,123 @@
+import hashlib
+import json
+import os
+import threading
+import time
+from datetime import datetime
+
+class RenderCache:
+    def __init__(self, cache_dir='render_cache', data_version='', max_age_hours=24):
+        """
+        Content-addressed store of rendered blueprints and their buy IDs,
+        keyed by the blueprint URL plus a stamp of the data it was rendered
+        with, so identical inputs are only ever rendered once.
+
+        Args:
+            cache_dir (str): Directory entries are kept in
+            data_version (str): Stamp of the app and data in use
+            max_age_hours (float): Ignore entries older than this, since league
+                rosters change even when our data doesn't (0 = never expire)
+        """
+        self.cache_dir = cache_dir
+        self.data_version = data_version
+        self.max_age = max_age_hours * 3600
+        self.hits = 0
+        self.misses = 0
+        self.lock = threading.Lock()
+        # key -> lock held while that key is being rendered
+        self.key_locks = {}
+        os.makedirs(cache_dir, exist_ok=True)
+
+    def key(self, url):
+        return hashlib.sha256(f"{self.data_version}\n{url}".encode('utf-8')).hexdigest()
+
+    def paths(self, key):
+        directory = os.path.join(self.cache_dir, key[:2])
+        return os.path.join(directory, f"{key}.png"), os.path.join(directory, f"{key}.json")
+
+    def lock_for(self, url):
+        """
+        Lock to hold across get, render and put, so a URL that comes up twice
+        at once is rendered by one worker and read from the cache by the other.
+        """
+        key = self.key(url)
+        with self.lock:
+            return self.key_locks.setdefault(key, threading.Lock())
+
+    def get(self, url):
+        """
+        Returns:
+            tuple: (png bytes, buy IDs) if this URL was rendered with the same data, else None
+        """
+        png_path, meta_path = self.paths(self.key(url))
+        try:
+            with open(meta_path, 'r') as file:
+                meta = json.load(file)
+            if meta['url'] != url or (self.max_age and time.time() - meta['created'] > self.max_age):
+                raise FileNotFoundError
+            with open(png_path, 'rb') as file:
+                image = file.read()
+        except (FileNotFoundError, json.JSONDecodeError, KeyError):
+            with self.lock:
+                self.misses += 1
+            return None
+        with self.lock:
+            self.hits += 1
+        return image, meta['buys']
+
+    def put(self, url, image, buy_ids):
+        """
+        Store a rendered blueprint.
+
+        Args:
+            url (str): URL it was rendered from
+            image (str or bytes): Path to the PNG, or its bytes
+            buy_ids (str): Buy IDs scraped from the page, if any
+        """
+        if isinstance(image, str):
+            with open(image, 'rb') as file:
+                image = file.read()
+        png_path, meta_path = self.paths(self.key(url))
+        os.makedirs(os.path.dirname(png_path), exist_ok=True)
+        # Write then rename so a crash never leaves a half-written entry
+        self.write_atomic(png_path, image)
+        meta = {'url': url, 'data_version': self.data_version, 'buys': buy_ids, 'created': time.time()}
+        self.write_atomic(meta_path, json.dumps(meta).encode('utf-8'))
+
+    def write_atomic(self, path, data):
+        tmp_path = f"{path}.{threading.get_ident()}.tmp"
+        with open(tmp_path, 'wb') as file:
+            file.write(data)
+        os.replace(tmp_path, path)
+
+    def print_stats(self):
+        print(f"Render cache: {self.hits} hits, {self.misses} misses")
+
+def default_data_version(dist_dir=None):
+    """
+    Stamp the app the blueprints are rendered with: every file under src/,
+    so the components as well as hooks.ts and the data JSON it imports (B/S/H,
+    rankings, players, ...), plus the built app when rendering from a local
+    build. Falls back to the current month when the app source isn't checked
+    out next to this script.
+
+    Args:
+        dist_dir (str, optional): Built app being served with --dist
+    """
+    repo_root = os.path.abspath(os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', '..'))
+    roots = [os.path.join(repo_root, 'src')]
+    if dist_dir:
+        roots.append(os.path.abspath(dist_dir))
+    if not os.path.isdir(roots[0]):
+        return datetime.now().strftime('%Y-%m')
+    digest = hashlib.sha256()
+    for root in roots:
+        for directory, subdirectories, files in os.walk(root):
+            # Walk in a fixed order so the same tree always hashes the same
+            subdirectories.sort()
+            for name in sorted(files):
+                path = os.path.join(directory, name)
+                digest.update(os.path.relpath(path, root).encode('utf-8'))
+                with open(path, 'rb') as file:
+                    digest.update(file.read())
+    return digest.hexdigest()[:16]
@@ -0,0 +1,99 @@
+import logging
+import random
+import smtplib
+import socket
+import threading
+import time
+
+class PermanentError(Exception):
+    """A failure retrying can't fix, e.g. a league that doesn't exist"""
+
+# Drive API statuses worth retrying; 403 only with one of the rate limit reasons
+TRANSIENT_HTTP_STATUSES = {408, 429, 500, 502, 503, 504}
+RATE_LIMIT_REASONS = ('rateLimitExceeded', 'userRateLimitExceeded', 'backendError')
+
+def is_transient(error):
+    """
+    Whether an error is likely to go away if the same work is tried again.
+
+    Unknown errors count as transient, so only failures known to be
+    permanent skip the retries.
+    """
+    if isinstance(error, PermanentError):
+        return False
+    if isinstance(error, smtplib.SMTPRecipientsRefused):
+        return False
+    if isinstance(error, smtplib.SMTPResponseException):
+        # 4xx replies are temporary by definition, 5xx are not
+        return 400 <= error.smtp_code < 500
+    if isinstance(error, (smtplib.SMTPServerDisconnected, socket.timeout, ConnectionError, TimeoutError)):
+        return True
+    # googleapiclient's HttpError, without importing it here
+    status = getattr(getattr(error, 'resp', None), 'status', None)
+    if status is not None:
+        status = int(status)
+        if status == 403:
+            return any(reason in str(error) for reason in RATE_LIMIT_REASONS)
+        return status in TRANSIENT_HTTP_STATUSES
+    return True
+
+class RetryPolicy:
+    def __init__(self, stage, attempts=3, base_delay=2, max_delay=60):
+        """
+        Retry one pipeline stage with exponential backoff and full jitter,
+        giving up straight away on permanent errors.
+
+        Args:
+            stage (str): Name of the stage, for logs and stats
+            attempts (int): Times to try before giving up
+            base_delay (float): Seconds to wait before the first retry; doubles each retry
+            max_delay (float): Cap on the wait between attempts
+        """
+        self.stage = stage
+        self.attempts = max(1, attempts)
+        self.base_delay = base_delay
+        self.max_delay = max_delay
+        self.retries = 0
+        self.gave_up = 0
+        self.permanent = 0
+        self.lock = threading.Lock()
+
+    def delay(self, retry):
+        """Seconds to wait before the given retry (0-based)"""
+        return random.uniform(0, min(self.max_delay, self.base_delay * 2 ** retry))
+
+    def call(self, fn, *args, label='', **kwargs):
+        """
+        Call fn(*args, **kwargs) until it returns, retrying transient errors.
+
+        Args:
+            label (str): What is being worked on, for log lines
+
+        Returns:
+            Whatever fn returns
+
+        Raises:
+            Exception: The last error, once it is permanent or attempts run out
+        """
+        for attempt in range(self.attempts):
+            try:
+                return fn(*args, **kwargs)
+            except Exception as e:
+                transient = is_transient(e)
+                final = not transient or attempt == self.attempts - 1
+                print(f"{self.stage} attempt {attempt + 1}/{self.attempts} failed for {label}: {str(e)}")
+                if final:
+                    with self.lock:
+                        if transient:
+                            self.gave_up += 1
+                        else:
+                            self.permanent += 1
+                    if transient:
+                        logging.exception(f"Giving up on {self.stage} for {label}")
+                    raise
+                with self.lock:
+                    self.retries += 1
+                time.sleep(self.delay(attempt))
+
+    def print_stats(self):
+        print(f"{self.stage}: {self.retries} retries, {self.gave_up} gave up, {self.permanent} permanent failures")
@@ -0,0 +1,171 @@
+import json
+import math
+import os
+import threading
+import time
+from contextlib import contextmanager
+from datetime import datetime
+
+# The stages a customer's own work is made of; queueing between them isn't counted
+ITEM_STAGES = ('render', 'optimize', 'upload', 'email')
+
+def percentile(values, p):
+    """Nearest-rank percentile of a list of numbers"""
+    if not values:
+        return None
+    ordered = sorted(values)
+    return ordered[max(0, math.ceil(p / 100 * len(ordered)) - 1)]
+
+class RunMetrics:
+    def __init__(self):
+        """
+        Collects how long each stage took for each customer, and when each
+        customer finished, for the run report.
+        """
+        self.lock = threading.Lock()
+        self.started = time.time()
+        # (item, stage, seconds, outcome)
+        self.samples = []
+        self.emails = {}
+        # item -> (finished at, outcome)
+        self.finished = {}
+
+    def record(self, item, stage, seconds, outcome='ok', email=None):
+        """
+        Args:
+            item (str, optional): Journal item the time belongs to; None for
+                work that isn't tied to one customer
+            stage (str): What was timed, e.g. 'navigate' or 'upload'
+            seconds (float): How long it took
+            outcome (str): 'ok', or the error's type name
+        """
+        with self.lock:
+            self.samples.append((item, stage, seconds, outcome))
+            if item is not None and email is not None:
+                self.emails[item] = email
+
+    @contextmanager
+    def timed(self, item, stage, email=None):
+        """Time the body of a with block, recording the error type if it raises"""
+        start = time.monotonic()
+        outcome = 'ok'
+        try:
+            yield
+        except Exception as e:
+            outcome = type(e).__name__
+            raise
+        finally:
+            self.record(item, stage, time.monotonic() - start, outcome, email)
+
+    def finish(self, item, outcome='ok', email=None):
+        """Mark a customer as done with this run, successfully or not"""
+        with self.lock:
+            self.finished[item] = (time.time(), outcome)
+            if email is not None:
+                self.emails[item] = email
+
+    def stage_stats(self):
+        stages = {}
+        for _, stage, seconds, outcome in self.samples:
+            stats = stages.setdefault(stage, {'durations': [], 'failures': 0})
+            stats['durations'].append(seconds)
+            if outcome != 'ok':
+                stats['failures'] += 1
+        report = {}
+        for stage, stats in stages.items():
+            durations = stats['durations']
+            report[stage] = {
+                'count': len(durations),
+                'failures': stats['failures'],
+                'total': round(sum(durations), 3),
+                'mean': round(sum(durations) / len(durations), 3),
+                **{f"p{p}": round(percentile(durations, p), 3) for p in (50, 90, 95, 99)},
+                'max': round(max(durations), 3),
+            }
+        return report
+
+    def item_stats(self):
+        items = {}
+        for item, stage, seconds, outcome in self.samples:
+            if item is None:
+                continue
+            entry = items.setdefault(item, {'email': self.emails.get(item), 'stages': {}, 'errors': []})
+            entry['stages'][stage] = round(entry['stages'].get(stage, 0) + seconds, 3)
+            if outcome != 'ok':
+                entry['errors'].append(f"{stage}: {outcome}")
+        for item, (_, outcome) in self.finished.items():
+            entry = items.setdefault(item, {'email': self.emails.get(item), 'stages': {}, 'errors': []})
+            entry['outcome'] = outcome
+        for entry in items.values():
+            # Only the top-level stages, so nested timings aren't counted twice
+            entry['seconds'] = round(sum(entry['stages'].get(stage, 0) for stage in ITEM_STAGES), 3)
+        return items
+
+    def throughput(self, bucket_seconds=60):
+        """Customers finished in each minute of the run, by outcome"""
+        buckets = {}
+        for finished_at, outcome in self.finished.values():
+            bucket = int((finished_at - self.started) // bucket_seconds)
+            counts = buckets.setdefault(bucket, {})
+            counts[outcome] = counts.get(outcome, 0) + 1
+        return [{'minute': bucket, **buckets[bucket]} for bucket in sorted(buckets)]
+
+    def write_report(self, path='run_report.json', run_id=None, policies=(), slowest=20):
+        """
+        Write the run report and print a short summary of it.
+
+        Args:
+            run_id (str): The run's journal ID
+            policies (iterable): RetryPolicy for each stage, for retry counts
+            slowest (int): How many of the slowest customers to list
+        """
+        with self.lock:
+            stages = self.stage_stats()
+            items = self.item_stats()
+            throughput = self.throughput()
+        elapsed = time.time() - self.started
+        completed = sum(1 for item in items.values() if item.get('outcome') == 'ok')
+        report = {
+            'run_id': run_id,
+            'started': datetime.fromtimestamp(self.started).isoformat(),
+            'elapsed_seconds': round(elapsed, 3),
+            'completed': completed,
+            'failed': sum(1 for item in items.values() if item.get('outcome') not in (None, 'ok')),
+            'per_minute': round(60 * completed / elapsed, 2) if elapsed else 0,
+            'stages': stages,
+            'retries': {
+                policy.stage: {'retries': policy.retries, 'gave_up': policy.gave_up, 'permanent': policy.permanent}
+                for policy in policies
+            },
+            'slowest': [
+                {'item': item, **entry}
+                for item, entry in sorted(items.items(), key=lambda pair: pair[1]['seconds'], reverse=True)[:slowest]
+            ],
+            'throughput': throughput,
+            'items': items,
+        }
+        tmp_path = f"{path}.tmp"
+        with open(tmp_path, 'w') as file:
+            json.dump(report, file, indent=4)
+        os.replace(tmp_path, path)
+
+        print(f"Run report written to {path}: {completed} done in {elapsed:.0f}s ({report['per_minute']}/min)")
+        for stage, stats in stages.items():
+            print(f"  {stage}: n={stats['count']} p50={stats['p50']:.1f}s p95={stats['p95']:.1f}s max={stats['max']:.1f}s failures={stats['failures']}")
+
+def load_report_durations(paths):
+    """
+    Per-customer work time from earlier run reports, for shard planning.
+    Later reports win.
+
+    Returns:
+        dict: email -> seconds
+    """
+    durations = {}
+    for path in paths:
+        with open(path, 'r') as file:
+            report = json.load(file)
+        for entry in report.get('items', {}).values():
+            if entry.get('email') and entry.get('seconds'):
+                durations[entry['email']] = entry['seconds']
+    return durations
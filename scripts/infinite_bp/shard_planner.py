@@ -0,0 +1,197 @@
+import argparse
+import glob
+import heapq
+import json
+import os
+import statistics
+from datetime import datetime
+import yaml
+
+from run_report import load_report_durations
+
+# Seconds assumed for a customer no earlier run has timed
+DEFAULT_DURATION = 60
+
+def get_chunk_indices(list_length, chunk_index, number_of_chunks):
+    """
+    Calculates the start and end indices (exclusive) for a specific chunk
+    of a list, distributing the data as evenly as possible.
+
+    Args:
+        list_length: The length of the list to be chunked.
+        chunk_index: The 1-indexed number of the chunk to retrieve (e.g., 1, 2, 3...).
+        number_of_chunks: The total number of chunks to divide the list into.
+
+    Returns:
+        A tuple (start_index, end_index) where end_index is exclusive.
+
+    Raises:
+        ValueError: If chunk_index or number_of_chunks are invalid (e.g., out of range).
+    """
+    # --- 1. Validation ---
+    if number_of_chunks <= 0:
+        raise ValueError("number_of_chunks must be a positive integer.")
+    if chunk_index <= 0 or chunk_index > number_of_chunks:
+        raise ValueError(
+            f"chunk_index ({chunk_index}) must be between 1 and number_of_chunks ({number_of_chunks})."
+        )
+    if list_length == 0:
+        return (0, 0)
+
+    # --- 2. Calculate Base Distribution Parameters ---
+    # base_size is the minimum size of any chunk (using integer division)
+    base_size = list_length // number_of_chunks
+    # extra_elements is the number of chunks that will be one element larger
+    extra_elements = list_length % number_of_chunks
+
+    # --- 3. Determine Start Index (Inclusive) ---
+
+    # The first 'extra_elements' chunks are size (base_size + 1).
+    # Chunks after that are size (base_size).
+
+    # a) Calculate total elements from 'base_size' in all preceding chunks (0-indexed)
+    preceding_chunks = chunk_index - 1
+    start_index = preceding_chunks * base_size
+
+    # b) Add the 'extra' element for all preceding chunks that were large
+    # This is the minimum of (how many chunks came before it) and (how many extra elements there are)
+    start_index += min(preceding_chunks, extra_elements)
+
+    # --- 4. Determine End Index (Exclusive) ---
+
+    # Check if the current chunk is one of the larger chunks
+    is_large_chunk = chunk_index <= extra_elements
+    chunk_size = base_size + (1 if is_large_chunk else 0)
+
+    end_index = start_index + chunk_size
+
+    return (start_index, end_index)
+
+def load_durations(journal_dir='runs'):
+    """
+    Work out how long each customer took in earlier runs from their journals.
+
+    A customer's duration runs from its last 'started' record to the
+    'uploaded' or 'failed' record that follows, so retries and timeouts
+    count against it. The most recent run wins.
+
+    Returns:
+        dict: email -> seconds
+    """
+    durations = {}
+    paths = [path for path in glob.glob(os.path.join(journal_dir, '*.jsonl')) if not path.endswith('-buys.jsonl')]
+    # Run IDs start with a timestamp, so sorting puts the latest run last
+    for path in sorted(paths):
+        started = {}
+        with open(path, 'r') as file:
+            for line in file:
+                try:
+                    record = json.loads(line)
+                except json.JSONDecodeError:
+                    continue
+                ts = datetime.fromisoformat(record['ts'])
+                if record['stage'] == 'started':
+                    started[record['email']] = ts
+                elif record['stage'] in ('uploaded', 'failed') and record['email'] in started:
+                    durations[record['email']] = (ts - started.pop(record['email'])).total_seconds()
+    return durations
+
+def plan_shards(emails, durations, number_of_chunks, indices=None):
+    """
+    Split customers into shards of roughly equal total duration using
+    longest-processing-time-first: the slowest customers are placed first,
+    each on the shard with the least work so far.
+
+    Args:
+        emails (list): Customer emails, by index
+        durations (dict): email -> seconds from earlier runs
+        number_of_chunks (int): Number of shards
+        indices (list, optional): Indices to plan, defaults to all of them
+
+    Returns:
+        tuple: (shards, loads), each shard a sorted list of indices and each
+            load its estimated seconds
+    """
+    if number_of_chunks <= 0:
+        raise ValueError("number_of_chunks must be a positive integer.")
+    if indices is None:
+        indices = range(len(emails))
+    default = statistics.median(durations.values()) if durations else DEFAULT_DURATION
+    costs = [(durations.get(emails[i], default), i) for i in indices]
+    costs.sort(key=lambda cost: (-cost[0], cost[1]))
+
+    shards = [[] for _ in range(number_of_chunks)]
+    heap = [(0.0, n) for n in range(number_of_chunks)]
+    for cost, i in costs:
+        load, n = heapq.heappop(heap)
+        shards[n].append(i)
+        heapq.heappush(heap, (load + cost, n))
+
+    loads = [0.0] * number_of_chunks
+    for load, n in heap:
+        loads[n] = load
+    return [sorted(shard) for shard in shards], loads
+
+def load_shard(plan_path, chunk_index, number_of_chunks, customer_count):
+    """
+    Read the indices of one chunk from a plan written by this script.
+
+    Raises:
+        ValueError: If the plan was made for a different chunk count or customer list
+    """
+    with open(plan_path, 'r') as file:
+        plan = json.load(file)
+    if plan['number_of_chunks'] != number_of_chunks:
+        raise ValueError(f"Shard plan has {plan['number_of_chunks']} chunks, but --number_of_chunks is {number_of_chunks}")
+    if plan['customers'] != customer_count:
+        raise ValueError(f"Shard plan covers {plan['customers']} customers, but the config has {customer_count}")
+    return plan['shards'][chunk_index - 1]
+
+def load_emails(config_path):
+    script_dir = os.path.dirname(os.path.abspath(__file__))
+    try:
+        with open(os.path.join(script_dir, config_path), 'r') as file:
+            config = yaml.safe_load(file)
+    except FileNotFoundError:
+        with open(config_path, 'r') as file:
+            config = yaml.safe_load(file)
+    if isinstance(config['email_list'], str):
+        return [email.strip() for email in config['email_list'].split(',')]
+    return config['email_list']
+
+def main():
+    parser = argparse.ArgumentParser(description="Plan balanced -ci/-nc shards from earlier runs' timings")
+    parser.add_argument('-nc', '--number_of_chunks', type=int, required=True, help="Number of chunks")
+    parser.add_argument('-j', '--journal_dir', default='runs', help="Directory of earlier run journals")
+    parser.add_argument('--config', default='config.yaml', help="Config with the customer email_list")
+    parser.add_argument('-r', '--report', action='append', default=[], help="Run report from monthly_image_sender.py; its per-customer work times replace the journals' (repeatable, later wins)")
+    parser.add_argument('-o', '--output', default='shard_plan.json', help="Where to write the plan")
+    args = parser.parse_args()
+
+    emails = load_emails(args.config)
+    durations = load_durations(args.journal_dir)
+    durations.update(load_report_durations(args.report))
+    shards, loads = plan_shards(emails, durations, args.number_of_chunks)
+    known = sum(1 for email in emails if email in durations)
+    print(f"Timed {known}/{len(emails)} customers from earlier runs")
+
+    even_loads = []
+    for chunk_index in range(1, args.number_of_chunks + 1):
+        (start, end) = get_chunk_indices(len(emails), chunk_index, args.number_of_chunks)
+        default = statistics.median(durations.values()) if durations else DEFAULT_DURATION
+        even_loads.append(sum(durations.get(emails[i], default) for i in range(start, end)))
+    for n, load in enumerate(loads):
+        print(f"Chunk {n + 1}: {len(shards[n])} customers, ~{load / 60:.1f} min")
+    print(f"Slowest chunk: ~{max(loads) / 60:.1f} min (equal-count chunks: ~{max(even_loads) / 60:.1f} min)")
+
+    with open(args.output, 'w') as file:
+        json.dump({
+            'number_of_chunks': args.number_of_chunks,
+            'customers': len(emails),
+            'estimated_seconds': loads,
+            'shards': shards,
+        }, file, indent=4)
+    print(f"Wrote {args.output}")
+
+if __name__ == '__main__':
+    main()
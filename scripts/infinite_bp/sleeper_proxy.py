@@ -0,0 +1,183 @@
+import hashlib
+import json
+import os
+import threading
+import time
+import urllib.error
+import urllib.request
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+SLEEPER_API = 'https://api.sleeper.app'
+
+# Chrome flags that let a publicly served page call the proxy on loopback
+CHROME_ARGS = ['--disable-features=BlockInsecurePrivateNetworkRequests,PrivateNetworkAccessRespectPreflightResults']
+
+# Injected into every page so the app's Sleeper API calls go through the proxy
+REWRITE_SCRIPT = """
+(function () {
+    const upstream = '%(upstream)s';
+    const proxy = '%(proxy)s';
+    const rewrite = url => typeof url === 'string' && url.startsWith(upstream) ? proxy + url.slice(upstream.length) : url;
+    const open = XMLHttpRequest.prototype.open;
+    XMLHttpRequest.prototype.open = function (method, url, ...rest) {
+        return open.call(this, method, rewrite(url), ...rest);
+    };
+    const fetch = window.fetch;
+    window.fetch = function (input, init) {
+        return fetch.call(this, typeof input === 'string' ? rewrite(input) : input, init);
+    };
+})();
+"""
+
+def fixture_path(fixtures_dir, path):
+    """Where the fixture for a Sleeper API path (e.g. /v1/league/123) lives"""
+    return os.path.join(fixtures_dir, f"{hashlib.sha256(path.encode('utf-8')).hexdigest()[:32]}.json")
+
+def write_fixture(fixtures_dir, path, response):
+    status, content_type, body = response
+    with open(fixture_path(fixtures_dir, path), 'w') as file:
+        json.dump({'path': path, 'status': status, 'content_type': content_type, 'body': body.decode('utf-8')}, file)
+
+def read_fixture(fixtures_dir, path):
+    """
+    Returns:
+        tuple: (status, content type, body bytes), or None if there is no fixture
+    """
+    try:
+        with open(fixture_path(fixtures_dir, path), 'r') as file:
+            fixture = json.load(file)
+    except FileNotFoundError:
+        return None
+    return fixture['status'], fixture['content_type'], fixture['body'].encode('utf-8')
+
+class SleeperProxy:
+    def __init__(self, mode='live', ttl=3600, fixtures_dir='sleeper_fixtures', port=0):
+        """
+        Loopback HTTP proxy for the Sleeper API that serves repeated requests
+        from a TTL-bounded cache, so customers sharing a league don't refetch
+        it and a batch run doesn't hammer Sleeper's rate limits.
+
+        Args:
+            mode (str): 'live' fetches from Sleeper, 'record' also saves every
+                response as a fixture, 'replay' serves only saved fixtures
+            ttl (float): Seconds a cached response stays valid
+            fixtures_dir (str): Where fixtures are saved and replayed from
+            port (int): Port to listen on, 0 for any free port
+        """
+        if mode not in ('live', 'record', 'replay'):
+            raise ValueError(f"Unknown Sleeper proxy mode: {mode}")
+        self.mode = mode
+        self.ttl = ttl
+        self.fixtures_dir = fixtures_dir
+        if mode != 'live':
+            os.makedirs(fixtures_dir, exist_ok=True)
+        self.cache = {}
+        self.lock = threading.Lock()
+        # path -> lock held while that path is fetched, so concurrent misses fetch once
+        self.fetch_locks = {}
+        self.hits = 0
+        self.misses = 0
+        self.errors = 0
+
+        proxy = self
+
+        class Handler(BaseHTTPRequestHandler):
+            def do_OPTIONS(self):
+                self.send_response(204)
+                self.send_cors_headers()
+                self.end_headers()
+
+            def do_GET(self):
+                status, content_type, body = proxy.get(self.path)
+                self.send_response(status)
+                self.send_cors_headers()
+                self.send_header('Content-Type', content_type)
+                self.send_header('Content-Length', str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+
+            def send_cors_headers(self):
+                self.send_header('Access-Control-Allow-Origin', '*')
+                self.send_header('Access-Control-Allow-Headers', '*')
+                self.send_header('Access-Control-Allow-Methods', 'GET, OPTIONS')
+                # The app is served publicly and the proxy is on loopback
+                self.send_header('Access-Control-Allow-Private-Network', 'true')
+
+            def log_message(self, format, *args):
+                pass
+
+        self.server = ThreadingHTTPServer(('127.0.0.1', port), Handler)
+        self.server.daemon_threads = True
+        self.url = f"http://127.0.0.1:{self.server.server_address[1]}"
+        self.thread = threading.Thread(target=self.server.serve_forever, daemon=True)
+
+    def start(self):
+        self.thread.start()
+        print(f"Sleeper proxy ({self.mode}) listening on {self.url}")
+        return self
+
+    def rewrite_script(self):
+        """Script that points the page's Sleeper API calls at this proxy"""
+        return REWRITE_SCRIPT % {'upstream': SLEEPER_API, 'proxy': self.url}
+
+    def get(self, path):
+        """
+        Returns:
+            tuple: (status, content type, body bytes) for a Sleeper API path
+        """
+        with self.lock:
+            cached = self.cache.get(path)
+            if cached and cached[0] > time.monotonic():
+                self.hits += 1
+                return cached[1]
+            fetch_lock = self.fetch_locks.setdefault(path, threading.Lock())
+
+        with fetch_lock:
+            # Another request may have fetched this path while we waited
+            with self.lock:
+                cached = self.cache.get(path)
+                if cached and cached[0] > time.monotonic():
+                    self.hits += 1
+                    return cached[1]
+                self.misses += 1
+            response = self.replay(path) if self.mode == 'replay' else self.fetch(path)
+            if response[0] == 200:
+                with self.lock:
+                    self.cache[path] = (time.monotonic() + self.ttl, response)
+                if self.mode == 'record':
+                    self.record(path, response)
+            return response
+
+    def fetch(self, path):
+        request = urllib.request.Request(SLEEPER_API + path, headers={'User-Agent': 'dynasty-ff-sender'})
+        try:
+            with urllib.request.urlopen(request, timeout=30) as upstream:
+                return upstream.status, upstream.headers.get('Content-Type', 'application/json'), upstream.read()
+        except urllib.error.HTTPError as e:
+            with self.lock:
+                self.errors += 1
+            return e.code, e.headers.get('Content-Type', 'text/plain'), e.read()
+        except Exception as e:
+            with self.lock:
+                self.errors += 1
+            return 502, 'text/plain', str(e).encode('utf-8')
+
+    def record(self, path, response):
+        write_fixture(self.fixtures_dir, path, response)
+
+    def replay(self, path):
+        response = read_fixture(self.fixtures_dir, path)
+        if response is None:
+            with self.lock:
+                self.errors += 1
+            return 404, 'text/plain', f"No fixture for {path}".encode('utf-8')
+        return response
+
+    def print_stats(self):
+        total = self.hits + self.misses
+        rate = 100 * self.hits / total if total else 0
+        print(f"Sleeper proxy: {self.hits} hits, {self.misses} misses ({rate:.0f}% hit rate), {self.errors} errors")
+
+    def stop(self):
+        self.server.shutdown()
+        self.server.server_close()
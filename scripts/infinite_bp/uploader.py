@@ -1,20 +1,54 @@
 from google.oauth2 import service_account
 from googleapiclient.discovery import build
-from googleapiclient.http import MediaFileUpload
+from googleapiclient.http import MediaFileUpload, MediaIoBaseUpload
+import io
 import os
+import threading
+import time
+
+from retry import RetryPolicy, is_transient
+from run_report import RunMetrics
+
+# Files up to this size go up in a single multipart request; bigger ones use
+# the resumable protocol, which costs an extra round trip to open a session.
+RESUMABLE_THRESHOLD = 5 * 1024 * 1024
+
+# Most calls the Drive API accepts in a single batch request
+BATCH_LIMIT = 100
 
 class GoogleDriveUploader:
-    def __init__(self, credentials_path):
+    def __init__(self, credentials_path, permission_policy=None):
         """
         Initialize the uploader with service account credentials.
 
         Args:
             credentials_path (str): Path to the service account JSON file
+            permission_policy (RetryPolicy, optional): Backoff between rounds of
+                retried permission changes
         """
         # Define the scopes
         self.SCOPES = ['https://www.googleapis.com/auth/drive.file']
         self.credentials_path = credentials_path
-        self.service = None
+        self.credentials = None
+        self.local = threading.local()
+        self.pending_permissions = []
+        self.permissions_lock = threading.Lock()
+        self.permission_policy = permission_policy or RetryPolicy('permissions')
+        # folder ID -> {file name: file ID}, filled in by build_folder_index
+        self.folder_indexes = {}
+        self.index_lock = threading.Lock()
+
+    @property
+    def service(self):
+        """
+        Drive client for the calling thread. Clients sit on top of httplib2,
+        which isn't thread-safe, so every thread gets its own.
+        """
+        service = getattr(self.local, 'service', None)
+        if service is None:
+            service = build('drive', 'v3', credentials=self.credentials)
+            self.local.service = service
+        return service
 
     def authenticate(self):
         """Authenticate using service account credentials."""
@@ -32,25 +66,30 @@ class GoogleDriveUploader:
                 )
 
             # Build the service
-            self.service = build('drive', 'v3', credentials=credentials)
+            self.credentials = credentials
+            self.local.service = build('drive', 'v3', credentials=credentials)
             print("Successfully authenticated with service account\n")
 
         except Exception as e:
             print(f"Authentication error: {str(e)}")
             raise
 
-    def upload_image(self, image_path, file_name=None, folder_id=None):
+    def upload_image(self, image, file_name=None, folder_id=None, upsert=False, raise_errors=False):
         """
         Upload an image to Google Drive.
 
         Args:
-            image_path (str): Path to the image file
+            image (str or bytes): Path to the image file, or its PNG bytes
+            file_name (str, optional): Name for the Drive file, required for bytes
             folder_id (str, optional): ID of the folder to upload to
+            upsert (bool): Replace the contents of a same-named file already in
+                folder_id instead of creating a duplicate
+            raise_errors (bool): Raise upload errors instead of returning None
         """
         try:
             # File metadata
             file_metadata = {
-                'name': os.path.basename(image_path) if file_name is None else file_name
+                'name': os.path.basename(image) if file_name is None else file_name
             }
 
             # If folder_id is provided, set it as the parent
@@ -58,27 +97,52 @@ class GoogleDriveUploader:
                 file_metadata['parents'] = [folder_id]
 
             # Create media file upload object
-            media = MediaFileUpload(
-                image_path,
-                mimetype='image/*',
-                resumable=True
-            )
+            if isinstance(image, bytes):
+                media = MediaIoBaseUpload(
+                    io.BytesIO(image),
+                    mimetype='image/png',
+                    resumable=len(image) > RESUMABLE_THRESHOLD
+                )
+            else:
+                media = MediaFileUpload(
+                    image,
+                    mimetype='image/*',
+                    resumable=os.path.getsize(image) > RESUMABLE_THRESHOLD
+                )
+
+            existing_id = None
+            if upsert and folder_id:
+                existing_id = self.build_folder_index(folder_id).get(file_metadata['name'])
 
             # Execute the upload
-            file = self.service.files().create(
-                body=file_metadata,
-                media_body=media,
-                fields='id, name, webViewLink',
-                supportsAllDrives=True
-            ).execute()
+            if existing_id:
+                file = self.service.files().update(
+                    fileId=existing_id,
+                    media_body=media,
+                    fields='id, name, webViewLink',
+                    supportsAllDrives=True
+                ).execute()
+            else:
+                file = self.service.files().create(
+                    body=file_metadata,
+                    media_body=media,
+                    fields='id, name, webViewLink',
+                    supportsAllDrives=True
+                ).execute()
 
             print(f"Successfully uploaded {file.get('name')}")
             print(f"Web View Link: {file.get('webViewLink')}")
 
+            with self.index_lock:
+                if folder_id in self.folder_indexes:
+                    self.folder_indexes[folder_id][file.get('name')] = file.get('id')
+
             return file
 
         except Exception as e:
             print(f"Upload error: {str(e)}")
+            if raise_errors:
+                raise
             return None
         
     def transfer_ownership(self, file_id, email):
@@ -160,7 +224,165 @@ class GoogleDriveUploader:
 
         except Exception as e:
             print(f"make_public error: {str(e)}")
+
+    def queue_transfer_ownership(self, file_id, email):
+        """Queue a transfer_ownership to be sent in the next permissions batch"""
+        self.queue_permission(f"transfer {file_id} to {email}", {
+            'fileId': file_id,
+            'body': {'type': 'user', 'role': 'owner', 'emailAddress': email},
+            'transferOwnership': True,
+        })
+
+    def queue_share_file(self, file_id, email):
+        """Queue a share_file to be sent in the next permissions batch"""
+        self.queue_permission(f"share {file_id} with {email}", {
+            'fileId': file_id,
+            'body': {'type': 'user', 'role': 'reader', 'emailAddress': email},
+        })
+
+    def queue_make_public(self, file_id):
+        """Queue a make_public to be sent in the next permissions batch"""
+        self.queue_permission(f"make {file_id} public", {
+            'fileId': file_id,
+            'body': {'type': 'anyone', 'role': 'reader'},
+        })
+
+    def queue_permission(self, label, request):
+        """
+        Queue a permissions().create call. Queued calls are sent once a full
+        batch has built up, or when flush_permissions is called.
+
+        Args:
+            label (str): Description used when reporting the result
+            request (dict): Arguments for permissions().create
+        """
+        with self.permissions_lock:
+            self.pending_permissions.append((label, request))
+            full = len(self.pending_permissions) >= BATCH_LIMIT
+        if full:
+            self.flush_permissions()
+
+    def flush_permissions(self):
+        """
+        Send queued permission changes as Drive batch requests of up to
+        BATCH_LIMIT calls. Calls that failed with a transient error are
+        retried in another round after the permission policy's backoff;
+        permanent errors, like a 404 or a 403 that isn't rate limiting, aren't.
+
+        Returns:
+            list: (label, error) for every call, error being None on success
+        """
+        with self.permissions_lock:
+            pending = self.pending_permissions
+            self.pending_permissions = []
+
+        policy = self.permission_policy
+        results = []
+        for attempt in range(policy.attempts):
+            if not pending:
+                break
+            if attempt > 0:
+                time.sleep(policy.delay(attempt - 1))
+            failed = []
+            for start in range(0, len(pending), BATCH_LIMIT):
+                chunk = pending[start:start + BATCH_LIMIT]
+                errors = self.execute_permission_batch(chunk)
+                for (label, request), error in zip(chunk, errors):
+                    if error is None:
+                        results.append((label, None))
+                        continue
+                    transient = is_transient(error)
+                    with policy.lock:
+                        if not transient:
+                            policy.permanent += 1
+                        elif attempt == policy.attempts - 1:
+                            policy.gave_up += 1
+                        else:
+                            policy.retries += 1
+                    if transient and attempt < policy.attempts - 1:
+                        failed.append((label, request))
+                    else:
+                        results.append((label, error))
+            pending = failed
+
+        errors = [result for result in results if result[1] is not None]
+        for label, error in errors:
+            print(f"Permission error ({label}): {str(error)}")
+        print(f"Applied {len(results) - len(errors)}/{len(results)} permission changes")
+        return results
+
+    def execute_permission_batch(self, chunk):
+        """
+        Run one batch of permissions().create calls.
+
+        Returns:
+            list: The exception for each call in chunk, or None if it succeeded
+        """
+        errors = [None] * len(chunk)
+
+        def callback(request_id, response, exception):
+            errors[int(request_id)] = exception
+
+        batch = self.service.new_batch_http_request(callback=callback)
+        for n, (label, request) in enumerate(chunk):
+            batch.add(
+                self.service.permissions().create(
+                    sendNotificationEmail=False,
+                    supportsAllDrives=True,
+                    **request
+                ),
+                request_id=str(n)
+            )
+        try:
+            batch.execute()
+        except Exception as e:
+            # The whole batch request failed, so every call in it did too
+            return [e] * len(chunk)
+        return errors
     
+    def build_folder_index(self, folder_id, refresh=False):
+        """
+        List every file in a folder, following pagination, and cache the
+        names. Later uploads to the folder are added to the cached index.
+
+        Args:
+            folder_id (str): ID of the folder to index
+            refresh (bool): Re-list the folder even if it's already cached
+
+        Returns:
+            dict: File name -> file ID
+        """
+        with self.index_lock:
+            if folder_id in self.folder_indexes and not refresh:
+                return self.folder_indexes[folder_id]
+
+        index = {}
+        page_token = None
+        while True:
+            response = self.service.files().list(
+                q=f"'{folder_id}' in parents and trashed = false",
+                fields='nextPageToken, files(id, name)',
+                pageSize=1000,
+                pageToken=page_token,
+                supportsAllDrives=True,
+                includeItemsFromAllDrives=True
+            ).execute()
+            for file in response.get('files', []):
+                index[file['name']] = file['id']
+            page_token = response.get('nextPageToken')
+            if not page_token:
+                break
+
+        with self.index_lock:
+            self.folder_indexes[folder_id] = index
+        print(f"Indexed {len(index)} files in folder {folder_id}")
+        return index
+
+    def indexed_file_id(self, folder_id, file_name):
+        """ID of a file in an indexed folder, or None if it isn't there"""
+        with self.index_lock:
+            return self.folder_indexes.get(folder_id, {}).get(file_name)
+
     def create_or_get_folder(self, folder_name):
         """Create or retrieve a folder in Google Drive"""
         # Check if folder already exists
@@ -192,6 +414,43 @@ class GoogleDriveUploader:
         
         return folder['id']
 
+class UploadEngine:
+    def __init__(self, uploader, attempts=3, upsert=False, policy=None, metrics=None):
+        """
+        Upload images to Google Drive with retries. Uploads run on the calling
+        thread; the pipeline's upload stage decides how many are in flight.
+
+        Args:
+            uploader (GoogleDriveUploader): Authenticated uploader; each calling
+                thread gets its own Drive client from it
+            attempts (int): Times to try each upload before giving up
+            upsert (bool): Update same-named files in place instead of duplicating them
+            policy (RetryPolicy, optional): Backoff between attempts; overrides attempts
+            metrics (RunMetrics, optional): Where each Drive request's time is recorded
+        """
+        self.uploader = uploader
+        self.policy = policy or RetryPolicy('upload', attempts)
+        self.metrics = metrics or RunMetrics()
+        self.upsert = upsert
+
+    def upload(self, image, file_name, folder_id, item=None):
+        """
+        Upload with retries, timing every Drive request.
+
+        Args:
+            item (str, optional): Journal item to attribute the timings to
+
+        Returns:
+            dict: The uploaded file's metadata, or None if every attempt failed
+        """
+        def attempt():
+            with self.metrics.timed(item, 'drive_request'):
+                return self.uploader.upload_image(image, file_name, folder_id, upsert=self.upsert, raise_errors=True)
+        try:
+            return self.policy.call(attempt, label=file_name)
+        except Exception:
+            return None
+
 def main():
     # Path to your service account credentials JSON file
     credentials_path = 'service-account-credentials.json'
@@ -0,0 +1,31 @@
+import {Fragment, ReactNode} from 'react';
+import {useLocation} from 'react-router-dom';
+import {DISALLOWED_BUYS, LEAGUE_ID, USER_ID} from './consts/urlParams';
+
+declare global {
+    interface Window {
+        /** Bumped by the batch renderer each time it changes blueprint */
+        __blueprintNavigation?: number;
+    }
+}
+
+// Params that pick the blueprint. teamId isn't one of them: pages write it
+// back to the URL themselves, and that mustn't throw their state away.
+const BLUEPRINT_PARAMS = [LEAGUE_ID, USER_ID, DISALLOWED_BUYS];
+
+/**
+ * Remounts its children whenever the blueprint in the URL changes, so a page
+ * whose state is seeded from URL params starts fresh when only the params
+ * change. The batch renderer relies on this to move between blueprints
+ * without reloading the app; it also bumps window.__blueprintNavigation, so
+ * blueprints that differ only by teamId are remounted too.
+ */
+export default function RemountOnSearch({children}: {children: ReactNode}) {
+    const {search} = useLocation();
+    const params = new URLSearchParams(search);
+    const key = [
+        ...BLUEPRINT_PARAMS.map(param => params.get(param) ?? ''),
+        window.__blueprintNavigation ?? 0,
+    ].join('|');
+    return <Fragment key={key}>{children}</Fragment>;
+}
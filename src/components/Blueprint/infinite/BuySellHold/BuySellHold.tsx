@@ -65,6 +65,8 @@ export function useBuySells(
     const [buys, setBuys] = useState<BuySellTileProps[]>([]);
     const [sells, setSells] = useState<BuySellTileProps[]>([]);
     const [holds, setHolds] = useState<BuySellTileProps[]>([]);
+    // Whether buys reflects this roster yet, even if it found no buys
+    const [computed, setComputed] = useState(false);
     const [disallowedBuys] = useDisallowedBuysFromUrl();
     const {
         qbBuys,
@@ -94,6 +96,7 @@ export function useBuySells(
         setBuys(calculateBuys());
         setSells(calculateSells());
         setHolds(calculateHolds());
+        setComputed(true);
     }, [
         qbBuys,
         rbBuys,
@@ -560,7 +563,7 @@ export function useBuySells(
             }));
     }
 
-    return {buys, sells, holds};
+    return {buys, sells, holds, computed};
 }
 
 /**
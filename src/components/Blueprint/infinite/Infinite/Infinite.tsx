@@ -32,6 +32,7 @@ import {
     User,
 } from '../../../../sleeper-api/sleeper-api';
 import ExportButton from '../../shared/ExportButton';
+import BlueprintReadySignal from '../../shared/BlueprintReadySignal';
 import RosterTierComponent, {
     RosterTier,
     useRosterTierAndPosGrades,
@@ -57,7 +58,8 @@ export default function Infinite() {
     const [allUsers, setAllUsers] = useState<User[]>([]);
     const [specifiedUser, setSpecifiedUser] = useState<User>();
     const [isNonSleeper, setIsNonSleeper] = useState(false);
-    const [buys, setBuys] = useState<BuySellTileProps[]>([]);
+    // Undefined until the buys have been computed
+    const [buys, setBuys] = useState<BuySellTileProps[]>();
     const {getAdp} = useAdpDataJson();
     useEffect(() => {
         if (!allUsers.length || !hasTeamId() || +teamId >= allUsers.length) {
@@ -206,7 +208,14 @@ export default function Infinite() {
                     }}
                 />
             )}
-            <span>{buys.map(b => b.playerId).join(',')}</span>
+            <BlueprintReadySignal
+                ready={
+                    startingLineup.some(
+                        ({player}) => player.first_name !== ''
+                    ) && buys !== undefined
+                }
+                buyIds={(buys ?? []).map(b => b.playerId)}
+            />
             <div className={styles.fullBlueprint}>
                 <div className={styles.startersGraphic}>
                     <StartersGraphic
@@ -424,7 +433,7 @@ export const BuySellHoldComponent = ({
     weekly?: boolean;
     inSeasonVerdict?: string;
 }) => {
-    const {buys, sells} = useBuySells(
+    const {buys, sells, computed} = useBuySells(
         isSuperFlex,
         leagueSize,
         roster,
@@ -434,10 +443,10 @@ export const BuySellHoldComponent = ({
     );
 
     useEffect(() => {
-        if (setBuys) {
+        if (setBuys && computed) {
             setBuys(buys);
         }
-    }, [setBuys, buys]);
+    }, [setBuys, buys, computed]);
 
     const column1 = '640px';
     const column2 = '1002px';
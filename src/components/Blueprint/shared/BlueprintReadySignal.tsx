@@ -0,0 +1,22 @@
+/**
+ * Marks a blueprint page as fully rendered for the batch renderer in
+ * scripts/infinite_bp, and carries the buy IDs it records per customer.
+ */
+export default function BlueprintReadySignal({
+    ready,
+    buyIds,
+}: {
+    ready: boolean;
+    buyIds: string[];
+}) {
+    const ids = buyIds.join(',');
+    return (
+        <span
+            id="blueprint-ready"
+            data-ready={ready ? 'true' : 'false'}
+            data-buy-ids={ids}
+        >
+            {ids}
+        </span>
+    );
+}
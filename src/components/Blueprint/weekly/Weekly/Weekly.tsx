@@ -24,6 +24,7 @@ import {
     User,
 } from '../../../../sleeper-api/sleeper-api';
 import ExportButton from '../../shared/ExportButton';
+import BlueprintReadySignal from '../../shared/BlueprintReadySignal';
 import {BuySellTileProps} from '../../infinite/BuySellHold/BuySellHold';
 import {QB, SUPER_FLEX} from '../../../../consts/fantasy';
 import {useEffect, useState} from 'react';
@@ -43,7 +44,8 @@ export default function Weekly() {
     const [leagueId] = useLeagueIdFromUrl();
     const [teamId, setTeamId] = useTeamIdFromUrl();
     const [userId] = useUserIdFromUrl();
-    const [buys, setBuys] = useState<BuySellTileProps[]>([]);
+    // Undefined until the buys have been computed
+    const [buys, setBuys] = useState<BuySellTileProps[]>();
     const [loaded, setLoaded] = useState(false);
     const [teamName, setTeamName] = useState('');
 
@@ -54,7 +56,10 @@ export default function Weekly() {
                 pngName={`${teamName}_weekly.png`}
                 disabled={!loaded}
             />
-            <span>{buys.map(b => b.playerId).join(',')}</span>
+            <BlueprintReadySignal
+                ready={loaded && buys !== undefined}
+                buyIds={(buys ?? []).map(b => b.playerId)}
+            />
             <WeeklyBlueprint
                 leagueId={leagueId}
                 teamId={teamId}
@@ -25,6 +25,7 @@ import BuySellHoldDashboard from './components/BuySellHoldDashboard/BuySellHoldD
 import UserIdHydrator from './components/UserIdHydrator/UserIdHydrator';
 import BlueprintModule from './components/Blueprint/BlueprintModule/BlueprintModule';
 import BodyBackgroundController from './BodyBackgroundController';
+import RemountOnSearch from './RemountOnSearch';
 import NewLive from './components/Blueprint/NewLive/NewLive';
 import NewInfinite from './components/Blueprint/NewInfinite/NewInfinite';
 import BlueprintDashboard from './components/Blueprint/BlueprintDashboard/BlueprintDashboard';
@@ -55,7 +56,14 @@ root.render(
                     />
                     <Route path="/blueprintv2" element={<NewGenerator />} />
                     <Route path="/rankings" element={<Rankings />} />
-                    <Route path="/infinite" element={<Infinite />} />
+                    <Route
+                        path="/infinite"
+                        element={
+                            <RemountOnSearch>
+                                <Infinite />
+                            </RemountOnSearch>
+                        }
+                    />
                     <Route path="/findteamid" element={<FindTeamId />} />
                     <Route
                         path="/nonsleeperinfinite"
@@ -64,7 +72,14 @@ root.render(
                     <Route path="live" element={<NewLive />} />
                     <Route path="/rookie" element={<RookieDraft />} />
                     <Route path="/whiteboard" element={<WhiteboardBase />} />
-                    <Route path="/weekly" element={<Weekly />} />
+                    <Route
+                        path="/weekly"
+                        element={
+                            <RemountOnSearch>
+                                <Weekly />
+                            </RemountOnSearch>
+                        }
+                    />
                     <Route path="/dashboard" element={<Dashboard />} />
                     <Route
                         path="/buysellholddashboard"